@@ -6,14 +6,12 @@ import os
 import sys
 sys.path.insert(0, '.')  # noqa
 
+from clay.startup import startup_profile
+
 import argparse
 
 from clay.core import meta
 from clay.playback.player import get_player
-import clay.ui.urwid as urwid
-
-
-player = get_player()
 
 
 class MultilineVersionAction(argparse.Action):
@@ -36,6 +34,8 @@ def main():
     """
     Starts the main clay process
     """
+    startup_profile.mark('core modules')
+
     try:
         from setproctitle import setproctitle
     except ImportError:
@@ -50,14 +50,28 @@ def main():
     )
 
     parser.add_argument("-v", "--version", action=MultilineVersionAction)
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long the startup phases take and quit")
 
     args = parser.parse_args()
 
     if args.version:
         exit(0)
 
+    startup_profile.enabled = args.profile_startup
+
+    get_player()
+    startup_profile.mark('player')
+
+    # Imported here so that --version doesn't wait for it and the profile can time it
+    import clay.ui.urwid as urwid
+    startup_profile.mark('ui modules')
+
     urwid.main()
 
+    if args.profile_startup:
+        print(startup_profile.format())
+
 
 if __name__ == '__main__':
     main()
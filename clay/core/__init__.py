@@ -9,4 +9,4 @@ from .gp import gp
 from .log import logger
 from .settings import settings_manager
 from .osd import osd_manager
-from .mpris2 import mpris2_manager
+from .offline import offline_manager
@@ -0,0 +1,386 @@
+"""
+Size-bounded cache of downloaded files.
+"""
+from threading import Lock, Thread
+from contextlib import closing
+from hashlib import sha1
+import atexit
+import errno
+import os
+import sqlite3
+import time
+import zlib
+
+
+class _Entry(object):
+    """
+    Index record of a cached file.
+    """
+    __slots__ = ('size', 'mtime', 'checksum', 'last_access', 'hits', 'pinned')
+
+    def __init__(self, size, mtime, checksum, last_access, hits=0, pinned=False):
+        self.size = size
+        self.mtime = mtime
+        self.checksum = checksum
+        self.last_access = last_access
+        self.hits = hits
+        self.pinned = pinned
+
+
+def get_checksum(path):
+    """
+    Return the CRC32 of the file at *path*.
+    """
+    checksum = 0
+    with open(path, 'rb') as cached_file:
+        for chunk in iter(lambda: cached_file.read(1024 * 1024), b''):
+            checksum = zlib.crc32(chunk, checksum)
+    return checksum
+
+
+class FileCache(object):
+    """
+    Cache of downloaded tracks and artist art with a byte budget.
+
+    Files are stored in ``files/<shard>/<filename>`` where the shard is derived from
+    the filename, so no directory grows too large. Size, last access, hit count and
+    pin state of every file are kept in an SQLite index that is read on startup;
+    lookups only consult the in-memory copy of the index.
+
+    Files are written to a part file and renamed into place once complete, so a crash
+    never leaves a truncated file behind. The size and modification time of a file
+    are checked the first time it is used in a session, its checksum is then verified
+    in the background so reading the file doesn't delay the playback.
+
+    When the budget is exceeded the least recently (``lru``) or least frequently
+    (``lfu``) used files that are not pinned are removed.
+    """
+    INDEX_FILENAME = 'cache_index.sqlite'
+    FILES_DIRNAME = 'files'
+    #: File types that are moved from the flat layout used by older versions
+    _LEGACY_EXTENSIONS = ('.mp3', '.jpg')
+
+    def __init__(self, directory, max_size=0, policy='lru'):
+        self._directory = directory
+        self.max_size = max_size
+        self.policy = policy
+        self._lock = Lock()
+        self._entries = {}
+        self._size = 0
+        self._touched = set()
+        self._verified = set()
+        self._pending_checks = []
+        self._checker = None
+
+        self._index_path = os.path.join(directory, self.INDEX_FILENAME)
+        if self._load_index():
+            self._import_legacy_files()
+        atexit.register(self.flush)
+
+    def _connect(self):
+        """
+        Open a new connection to the index, SQLite connections can't be shared between threads.
+        """
+        return sqlite3.connect(self._index_path)
+
+    def _load_index(self):
+        """
+        Read the index into memory. Returns ``True`` if the index was just created.
+        """
+        with closing(self._connect()) as connection, connection:
+            created = connection.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'files'"
+            ).fetchone()[0] == 0
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, size INTEGER, '
+                'mtime REAL, checksum INTEGER, last_access REAL, hits INTEGER, pinned INTEGER)'
+            )
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(files)')]
+            if 'checksum' not in columns:
+                connection.execute('ALTER TABLE files ADD COLUMN checksum INTEGER')
+            if 'mtime' not in columns:
+                connection.execute('ALTER TABLE files ADD COLUMN mtime REAL')
+            rows = connection.execute(
+                'SELECT filename, size, mtime, checksum, last_access, hits, pinned FROM files'
+            ).fetchall()
+
+        for filename, size, mtime, checksum, last_access, hits, pinned in rows:
+            self._entries[filename] = _Entry(size, mtime, checksum, last_access, hits,
+                                             bool(pinned))
+            self._size += size
+        return created
+
+    def _import_legacy_files(self):
+        """
+        Move files cached in the flat layout of older versions into the shards.
+        Their checksums are left empty and computed in the background the first time
+        they are used, so a large legacy cache doesn't delay the startup.
+        """
+        imported = []
+        for filename in os.listdir(self._directory):
+            if not filename.endswith(self._LEGACY_EXTENSIONS):
+                continue
+            path = self.get_storage_path(filename, create=True)
+            try:
+                os.replace(os.path.join(self._directory, filename), path)
+                stat = os.stat(path)
+            except OSError:
+                continue
+            self._entries[filename] = _Entry(stat.st_size, stat.st_mtime, None, stat.st_mtime)
+            self._size += stat.st_size
+            imported.append(filename)
+
+        if not imported:
+            return
+
+        with self._lock:
+            evicted = self._evict(keep=None)
+            with closing(self._connect()) as connection, connection:
+                self._write_entries(connection, imported)
+                connection.executemany('DELETE FROM files WHERE filename = ?',
+                                       [(name,) for name in evicted])
+
+        for name in evicted:
+            self._unlink(name)
+
+    def _write_entries(self, connection, filenames):
+        """
+        Write the index records of *filenames* using *connection*.
+        """
+        rows = []
+        for filename in filenames:
+            entry = self._entries.get(filename)
+            if entry is not None:
+                rows.append((filename, entry.size, entry.mtime, entry.checksum,
+                             entry.last_access, entry.hits, int(entry.pinned)))
+        connection.executemany(
+            'INSERT OR REPLACE INTO files '
+            '(filename, size, mtime, checksum, last_access, hits, pinned) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            rows
+        )
+
+    def flush(self):
+        """
+        Write the pending access times and hit counts to the index.
+        """
+        with self._lock:
+            touched, self._touched = self._touched, set()
+            if not touched:
+                return
+            with closing(self._connect()) as connection, connection:
+                self._write_entries(connection, touched)
+
+    def get_storage_path(self, filename, create=False):
+        """
+        Return the path *filename* is stored at, whether it is cached or not.
+        Pass *create* to create the shard directory before writing the file.
+        """
+        shard = os.path.join(self._directory, self.FILES_DIRNAME,
+                             sha1(filename.encode('utf-8')).hexdigest()[:2])
+        if create:
+            try:
+                os.makedirs(shard)
+            except OSError as error:
+                if error.errno != errno.EEXIST:
+                    raise
+        return os.path.join(shard, filename)
+
+    def __contains__(self, filename):
+        return filename in self._entries
+
+    @property
+    def size(self):
+        """
+        Return the total size of the cached files in bytes.
+        """
+        return self._size
+
+    def get_path(self, filename):
+        """
+        Return the path of cached *filename* and record the access, ``None`` if it isn't cached.
+        Only the size and modification time are checked here, the checksum of a file that
+        wasn't verified yet in this session is checked in the background.
+        """
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is None:
+                return None
+            entry.last_access = time.time()
+            entry.hits += 1
+            self._touched.add(filename)
+
+        path = self.get_storage_path(filename)
+        if filename not in self._verified:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat is None or stat.st_size != entry.size or \
+                    (entry.mtime is not None and stat.st_mtime != entry.mtime):
+                self.remove(filename)
+                return None
+            self._verified.add(filename)
+            self._check_later(filename, entry)
+        return path
+
+    def _check_later(self, filename, entry):
+        """
+        Queue the checksum of *filename* to be verified by the checker thread,
+        starting it if it isn't running.
+        """
+        with self._lock:
+            self._pending_checks.append((filename, entry))
+            if self._checker is None:
+                self._checker = Thread(target=self._check_pending)
+                self._checker.daemon = True
+                self._checker.start()
+
+    def _check_pending(self):
+        """
+        Verify the queued checksums until the queue is empty.
+        Broken files are removed, a missing checksum is computed and stored on the next flush.
+        """
+        while True:
+            with self._lock:
+                if not self._pending_checks:
+                    self._checker = None
+                    return
+                filename, entry = self._pending_checks.pop(0)
+
+            try:
+                checksum = get_checksum(self.get_storage_path(filename))
+            except OSError:
+                checksum = None
+
+            with self._lock:
+                if self._entries.get(filename) is not entry:
+                    # Removed or replaced while it was being read
+                    continue
+                if checksum is not None and entry.checksum is None:
+                    # Imported from an older version
+                    entry.checksum = checksum
+                    self._touched.add(filename)
+                    continue
+                broken = checksum is None or checksum != entry.checksum
+            if broken:
+                self.remove(filename)
+
+    def add(self, filename, checksum=None, pinned=False):
+        """
+        Add *filename*, which was written to :meth:`get_storage_path`, to the index.
+        Pass *pinned* to pin it right away, see :meth:`pin`.
+        Evicts other files if the cache grows over budget.
+        """
+        path = self.get_storage_path(filename)
+        stat = os.stat(path)
+        if checksum is None:
+            checksum = get_checksum(path)
+
+        with self._lock:
+            old = self._entries.get(filename)
+            if old is not None:
+                self._size -= old.size
+            self._entries[filename] = _Entry(
+                stat.st_size, stat.st_mtime, checksum, time.time(), old.hits if old else 0,
+                pinned or (old.pinned if old else False)
+            )
+            self._verified.add(filename)
+            self._size += stat.st_size
+            self._touched.discard(filename)
+            evicted = self._evict(keep=filename)
+
+            with closing(self._connect()) as connection, connection:
+                self._write_entries(connection, [filename])
+                connection.executemany('DELETE FROM files WHERE filename = ?',
+                                       [(name,) for name in evicted])
+
+        for name in evicted:
+            self._unlink(name)
+
+    def save(self, filename, content):
+        """
+        Store *content* as *filename* and return its path.
+        """
+        path = self.get_storage_path(filename, create=True)
+        with open(path + '.part', 'wb') as cachefile:
+            cachefile.write(content)
+        os.replace(path + '.part', path)
+        self.add(filename, zlib.crc32(content))
+        return path
+
+    def remove(self, filename):
+        """
+        Remove *filename* from the cache, e.g. because it turned out to be missing or broken.
+        """
+        with self._lock:
+            entry = self._entries.pop(filename, None)
+            if entry is None:
+                return
+            self._size -= entry.size
+            self._touched.discard(filename)
+            self._verified.discard(filename)
+            with closing(self._connect()) as connection, connection:
+                connection.execute('DELETE FROM files WHERE filename = ?', (filename,))
+        self._unlink(filename)
+
+    def pin(self, filename, pinned=True):
+        """
+        Exclude *filename* from eviction, or include it again if *pinned* is ``False``.
+        """
+        self.pin_all([filename], pinned)
+
+    def pin_all(self, filenames, pinned=True):
+        """
+        Pin or unpin all of *filenames* in a single index transaction, see :meth:`pin`.
+        Files that aren't cached are skipped.
+        """
+        with self._lock:
+            changed = []
+            for filename in filenames:
+                entry = self._entries.get(filename)
+                if entry is not None and entry.pinned != pinned:
+                    entry.pinned = pinned
+                    self._touched.discard(filename)
+                    changed.append(filename)
+            if not changed:
+                return
+            with closing(self._connect()) as connection, connection:
+                self._write_entries(connection, changed)
+
+    def _evict(self, keep):
+        """
+        Drop entries until the cache fits its budget, never *keep* or pinned files.
+        Returns the evicted filenames, the caller deletes the files.
+        """
+        if not self.max_size or self._size <= self.max_size:
+            return []
+
+        if self.policy == 'lfu':
+            key = lambda item: (item[1].hits, item[1].last_access)
+        else:
+            key = lambda item: item[1].last_access
+        candidates = sorted(
+            (item for item in self._entries.items() if not item[1].pinned and item[0] != keep),
+            key=key
+        )
+
+        evicted = []
+        for filename, entry in candidates:
+            if self._size <= self.max_size:
+                break
+            del self._entries[filename]
+            self._touched.discard(filename)
+            self._verified.discard(filename)
+            self._size -= entry.size
+            evicted.append(filename)
+        return evicted
+
+    def _unlink(self, filename):
+        """
+        Delete the file of *filename*, if it is still there.
+        """
+        try:
+            os.remove(self.get_storage_path(filename))
+        except OSError:
+            pass
@@ -0,0 +1,608 @@
+"""
+Track downloads into the cache, shared by the stream proxy and the offline sync.
+"""
+import os
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from threading import Thread, Lock, Condition, Timer
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+
+from .log import logger
+from .settings import settings_manager
+
+#: Bytes read from the server at once
+CHUNK_SIZE = 64 * 1024
+#: Bytes requested at once when a download is split into ranges
+SEGMENT_SIZE = 1024 * 1024
+
+# Segment states
+_PENDING = 0
+_FETCHING = 1
+_DONE = 2
+
+_downloads = {}
+_lock = Lock()
+
+
+class _Cancelled(Exception):
+    """
+    Raised in the threads of a download once it was cancelled.
+    """
+
+
+class _ConnectionPool(object):
+    """
+    Keeps idle HTTP connections per host, so the ranges of a download and
+    the following downloads don't pay for a new TCP and TLS handshake.
+    """
+    #: Idle connections kept per host
+    MAX_IDLE = 8
+    MAX_REDIRECTS = 5
+    #: Seconds a connection may stall before the request fails
+    TIMEOUT = 30
+
+    def __init__(self):
+        self._idle = {}
+        self._lock = Lock()
+
+    def request(self, url, start=0, end=None):
+        """
+        Request the bytes from *start* to *end* (inclusive, ``None`` for the rest) of *url*,
+        following redirects. Raises :class:`HTTPError` for error responses.
+
+        Returns the connection and the response, hand both back with :meth:`release`.
+        """
+        headers = {}
+        if start or end is not None:
+            headers['Range'] = 'bytes={}-{}'.format(start, '' if end is None else end)
+
+        for _ in range(self.MAX_REDIRECTS):
+            connection, response = self._send(url, headers)
+            if response.status in (301, 302, 303, 307, 308) and 'Location' in response.headers:
+                url = urljoin(url, response.headers['Location'])
+                response.read()
+                self.release(connection, response)
+                continue
+            if response.status >= 400:
+                response.read()
+                self.release(connection, response)
+                raise HTTPError(url, response.status, response.reason, response.headers, None)
+            return connection, response
+
+        raise HTTPException('Too many redirects for {}'.format(url))
+
+    def _send(self, url, headers):
+        """
+        Send a GET request on an idle or a new connection.
+        Retries once on a new connection if the server closed the idle one.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+
+        with self._lock:
+            idle = self._idle.get(key)
+            connection = idle.pop() if idle else None
+
+        while True:
+            reused = connection is not None
+            if not reused:
+                connection_class = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+                connection = connection_class(parts.netloc, timeout=self.TIMEOUT)
+                connection.pool_key = key
+            try:
+                connection.request('GET', path, headers=headers)
+                return connection, connection.getresponse()
+            except (OSError, HTTPException):
+                connection.close()
+                if not reused:
+                    raise
+                connection = None
+
+    def release(self, connection, response):
+        """
+        Keep *connection* for the next request if *response* was read completely.
+        """
+        if response.isclosed() and not response.will_close:
+            with self._lock:
+                idle = self._idle.setdefault(connection.pool_key, [])
+                if len(idle) < self.MAX_IDLE:
+                    idle.append(connection)
+                    return
+        connection.close()
+
+
+_connection_pool = _ConnectionPool()
+
+
+class Download(object):
+    """
+    Downloads a track into a part file in the cache while any number of
+    readers follow it. Moves the part file into place once it is complete.
+
+    The part file is kept if the download fails, the next download of the track
+    resumes it with a ``Range`` request. Dropped connections are resumed right away.
+
+    Once the size is known the rest of the track is split into segments of
+    :data:`SEGMENT_SIZE`. The download thread keeps streaming the segment at the end
+    of the part file while up to ``download_connections - 1`` helpers fetch the next
+    segments into files of their own, which are appended once the stream reaches them.
+    Readers always see the contiguous start of the track.
+
+    Background downloads call their *throttle* before every chunk, the download
+    becomes a foreground one as soon as the player asks for the track. Once the player
+    stopped reading it for :attr:`READER_TIMEOUT` seconds, e.g. because the track was
+    skipped, it becomes a background download again if the offline sync wants it and is
+    cancelled otherwise. A cancelled download leaves its part file for the next one.
+    """
+    #: Connection attempts before the download is given up
+    MAX_ATTEMPTS = 3
+    #: Seconds without readers before a foreground download is demoted or cancelled,
+    #: the player reconnects when it seeks
+    READER_TIMEOUT = 5
+
+    def __init__(self, filename, url, background=False, throttle=None, pinned=False):
+        self.filename = filename
+        self.url = url
+        self.background = background
+        self.throttle = throttle
+        #: Pin the file when it is added to the cache, so it can't be evicted before
+        #: the offline sync sees it
+        self.pinned = pinned
+        self.final_path = settings_manager.file_cache.get_storage_path(filename, create=True)
+        self.path = self.final_path + '.part'
+        self.size = None
+        self.downloaded = 0
+        self.error = None
+        self.done = False
+        self.cancelled = False
+        self._started = False
+        self._segments = None
+        self._helpers = 0
+        self._readers = 0
+        self._reader_timer = None
+        # A cancelled or failed download of the same file that may still be writing
+        self._previous = None
+        self._condition = Condition()
+
+    def start(self):
+        """
+        Start downloading in the background.
+        """
+        Thread(target=self._run, daemon=True).start()
+
+    def attach_reader(self):
+        """
+        Register a reader, call :meth:`detach_reader` once it stopped reading.
+        """
+        with self._condition:
+            self._readers += 1
+            if self._reader_timer is not None:
+                self._reader_timer.cancel()
+                self._reader_timer = None
+
+    def detach_reader(self):
+        """
+        Unregister a reader, see :meth:`attach_reader`.
+        """
+        with self._condition:
+            self._readers -= 1
+            if self._readers or self.done or self.background:
+                return
+            self._reader_timer = Timer(self.READER_TIMEOUT, self._on_readers_gone)
+            self._reader_timer.daemon = True
+            self._reader_timer.start()
+
+    def _on_readers_gone(self):
+        """
+        Demote or cancel the download because the player stopped reading it.
+        """
+        with self._condition:
+            self._reader_timer = None
+            if self._readers or self.done or self.background:
+                return
+            if self.throttle is not None:
+                # The offline sync still wants the track
+                self.background = True
+                return
+            self.cancelled = True
+            self._condition.notify_all()
+        logger.debug('Cancelling the download of %s, the player stopped reading it',
+                     self.filename)
+
+    def open(self):
+        """
+        Open the downloaded data for reading, wherever it is by now.
+        """
+        try:
+            return open(self.path, 'rb')
+        except FileNotFoundError:
+            return open(self.final_path, 'rb')
+
+    def _run(self):
+        """
+        Thread body.
+        """
+        try:
+            if self._previous is not None:
+                self._previous.wait()
+                self._previous = None
+            self._remove_stale_segment_files()
+            try:
+                self.downloaded = os.path.getsize(self.path)
+            except OSError:
+                self.downloaded = 0
+
+            attempt = 1
+            while True:
+                try:
+                    self._fetch()
+                    break
+                except HTTPError as error:
+                    if error.code != 416 or not self.downloaded:
+                        raise
+                    # The part file is already complete or doesn't match the track anymore
+                    self._truncate()
+                except (OSError, HTTPException) as error:
+                    if attempt == self.MAX_ATTEMPTS:
+                        raise
+                    attempt += 1
+                    logger.debug('Resuming download of %s at %d: %s',
+                                 self.filename, self.downloaded, str(error))
+
+            if self.size is not None and self.downloaded != self.size:
+                raise OSError('Size mismatch in download of {}'.format(self.filename))
+
+            os.replace(self.path, self.final_path)
+            settings_manager.register_cached_file(self.filename, pinned=self.pinned)
+            # The cache serves the track from now on
+            with _lock:
+                if _downloads.get(self.filename) is self:
+                    del _downloads[self.filename]
+        except _Cancelled as error:
+            self.error = error
+            # The next request resumes the part file
+            with _lock:
+                if _downloads.get(self.filename) is self:
+                    del _downloads[self.filename]
+        except (OSError, HTTPException, ValueError) as error:
+            logger.error('Failed to download %s: %s', self.filename, str(error))
+            self.error = error
+        finally:
+            with self._condition:
+                self.done = True
+                self._condition.notify_all()
+                segments = list(self._segments or ())
+            # Helpers that are still fetching remove their own file
+            for start in segments:
+                self._remove_segment_file(start)
+
+    def _fetch(self):
+        """
+        Request the track from :attr:`downloaded` on and append it to the part file.
+        """
+        connections = max(settings_manager.get('download_connections', 'play_settings'), 1)
+        if connections > 1 and self._segments is not None:
+            # Resuming a split download
+            self._fetch_segments(connections)
+            return
+
+        end = self._get_segment_end(self.downloaded) if connections > 1 else None
+        connection, response = _connection_pool.request(self.url, self.downloaded, end)
+        try:
+            if response.status != 206:
+                # The server sends the whole track
+                self._truncate()
+            content_range = response.headers.get('Content-Range')
+            length = response.headers.get('Content-Length')
+            if content_range:
+                size = int(content_range.rpartition('/')[2])
+            else:
+                size = int(length) if length else None
+
+            with open(self.path, 'ab') as part:
+                with self._condition:
+                    self.size = size
+                    self._started = True
+                    self._condition.notify_all()
+
+                self._copy(response, part, advance=True)
+        finally:
+            _connection_pool.release(connection, response)
+
+        if response.status == 206 and end is not None and self.downloaded == end + 1 \
+                and self.downloaded < self.size:
+            self._fetch_segments(connections)
+
+        if self.size is not None and self.downloaded < self.size:
+            raise OSError('Connection closed after {} bytes'.format(self.downloaded))
+
+    def _copy(self, response, output, advance=False):
+        """
+        Copy the body of *response* to *output*, throttled if this is a background download.
+        Pass *advance* if *output* is the part file. Returns the number of copied bytes.
+        """
+        copied = 0
+        while True:
+            if self.cancelled:
+                raise _Cancelled()
+            if self.background and self.throttle is not None:
+                self.throttle(CHUNK_SIZE)
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            output.write(chunk)
+            copied += len(chunk)
+            if advance:
+                output.flush()
+                with self._condition:
+                    self.downloaded += len(chunk)
+                    self._condition.notify_all()
+        return copied
+
+    @staticmethod
+    def _get_segment_end(position):
+        """
+        Return the last byte of the segment that contains *position*.
+        """
+        return (position // SEGMENT_SIZE + 1) * SEGMENT_SIZE - 1
+
+    def _get_segment_path(self, start):
+        """
+        Return the path of the file the segment at *start* is fetched into by a helper.
+        """
+        return '{}.{}'.format(self.path, start)
+
+    def _remove_stale_segment_files(self):
+        """
+        Delete the segment files an earlier run of Clay left behind.
+        """
+        directory, name = os.path.split(self.path)
+        prefix = name + '.'
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return
+        for other in names:
+            if other.startswith(prefix) and other[len(prefix):].isdigit():
+                self._remove_segment_file(int(other[len(prefix):]))
+
+    def _remove_segment_file(self, start):
+        """
+        Delete the file of the segment at *start*.
+        """
+        try:
+            os.remove(self._get_segment_path(start))
+        except OSError:
+            pass
+
+    def _fetch_range(self, output, start, end, advance=False):
+        """
+        Fetch the bytes from *start* to *end* (inclusive) into *output*.
+        """
+        connection, response = _connection_pool.request(self.url, start, end)
+        try:
+            if response.status != 206 or not response.headers.get('Content-Range', '') \
+                    .startswith('bytes {}-'.format(start)):
+                raise HTTPException('Server ignored the range of {}'.format(self.filename))
+            copied = self._copy(response, output, advance)
+        finally:
+            _connection_pool.release(connection, response)
+
+        if copied != end - start + 1:
+            raise OSError('Connection closed after {} bytes'.format(start + copied))
+
+    def _fetch_segments(self, connections):
+        """
+        Fetch the rest of the track segment by segment with *connections* connections.
+        """
+        with self._condition:
+            if self._segments is None:
+                self._segments = {
+                    start: _PENDING for start
+                    in range(self._get_segment_end(self.downloaded) + 1, self.size, SEGMENT_SIZE)
+                }
+            while self._helpers < connections - 1:
+                self._helpers += 1
+                Thread(target=self._fetch_ahead, daemon=True).start()
+
+        with open(self.path, 'ab') as part:
+            while self.downloaded < self.size:
+                with self._condition:
+                    if self.cancelled:
+                        raise _Cancelled()
+                    start = self._get_segment_end(self.downloaded) + 1 - SEGMENT_SIZE
+                    state = self._segments.get(start, _PENDING)
+                    ahead = None
+                    if state == _FETCHING:
+                        # Don't idle while a helper fetches the next segment
+                        ahead = self._take_segment()
+                        if ahead is None:
+                            self._condition.wait()
+                            continue
+                    elif state == _PENDING:
+                        self._segments[start] = _FETCHING
+
+                if ahead is not None:
+                    if not self._fetch_segment(ahead):
+                        if self.cancelled:
+                            raise _Cancelled()
+                        raise OSError('Failed to fetch {} at {}'.format(self.filename, ahead))
+                elif state == _DONE:
+                    self._append_segment(part, start)
+                else:
+                    self._stream_segment(part, start)
+
+    def _stream_segment(self, part, start):
+        """
+        Fetch the rest of the segment at *start* directly into the part file.
+        """
+        try:
+            self._fetch_range(part, self.downloaded,
+                              min(self._get_segment_end(start), self.size - 1), advance=True)
+        finally:
+            with self._condition:
+                if self.downloaded > start:
+                    self._segments.pop(start, None)
+                elif start in self._segments:
+                    self._segments[start] = _PENDING
+
+    def _append_segment(self, part, start):
+        """
+        Move the segment at *start* that was fetched into its own file to the end of the part file.
+        """
+        with open(self._get_segment_path(start), 'rb') as segment:
+            while True:
+                data = segment.read(CHUNK_SIZE)
+                if not data:
+                    break
+                part.write(data)
+                part.flush()
+                with self._condition:
+                    self.downloaded += len(data)
+                    self._condition.notify_all()
+
+        with self._condition:
+            del self._segments[start]
+        self._remove_segment_file(start)
+
+    def _take_segment(self):
+        """
+        Mark the first pending segment after the streamed one as being fetched and return
+        its start, ``None`` if there is none. The lock must be held.
+        """
+        start = next((start for start, state in self._segments.items()
+                      if state == _PENDING and start > self.downloaded), None)
+        if start is not None:
+            self._segments[start] = _FETCHING
+        return start
+
+    def _fetch_segment(self, start):
+        """
+        Fetch the segment at *start* into its own file. Returns ``False`` if that failed.
+        """
+        error = None
+        try:
+            with open(self._get_segment_path(start), 'wb') as segment:
+                self._fetch_range(segment, start,
+                                  min(self._get_segment_end(start), self.size - 1))
+        except (OSError, HTTPException) as exception:
+            error = exception
+            logger.debug('Failed to fetch %s at %d: %s', self.filename, start, str(error))
+        except _Cancelled as exception:
+            error = exception
+
+        with self._condition:
+            self._segments[start] = _PENDING if error else _DONE
+            self._condition.notify_all()
+        return error is None
+
+    def _fetch_ahead(self):
+        """
+        Helper thread body: fetch the pending segments after the streamed one.
+        """
+        while True:
+            with self._condition:
+                start = None if self.done else self._take_segment()
+                if start is None:
+                    self._helpers -= 1
+                    return
+
+            if not self._fetch_segment(start) or self.done:
+                with self._condition:
+                    self._helpers -= 1
+                self._remove_segment_file(start)
+                return
+
+    def _truncate(self):
+        """
+        Throw away the part file, the download starts over.
+        """
+        with open(self.path, 'wb'):
+            pass
+        with self._condition:
+            self.downloaded = 0
+
+    def wait_for_headers(self):
+        """
+        Block until the server answered. Returns ``False`` if the download failed.
+        """
+        with self._condition:
+            while not self._started and not self.done:
+                self._condition.wait()
+            return self._started
+
+    def wait_for(self, position):
+        """
+        Block until the byte at *position* is downloaded or the download ended.
+        Returns the number of downloaded bytes.
+        """
+        with self._condition:
+            while self.downloaded <= position and not self.done:
+                self._condition.wait()
+            return self.downloaded
+
+    def wait(self):
+        """
+        Block until the download ended. Returns ``True`` if it succeeded.
+        """
+        with self._condition:
+            while not self.done:
+                self._condition.wait()
+        return self.error is None
+
+
+def get_download(filename):
+    """
+    Return the running or failed :class:`.Download` of *filename*, ``None`` if there is none.
+    """
+    with _lock:
+        return _downloads.get(filename)
+
+
+def start_download(filename, url, background=False, throttle=None, pinned=False):
+    """
+    Start downloading *filename* from *url* and return the :class:`.Download`.
+    Pass *pinned* to pin the file once it is cached.
+
+    Returns the running download of *filename* instead if there is one, a foreground
+    request turns a running background download into a foreground one.
+    A failed or cancelled download is replaced.
+    """
+    with _lock:
+        download = _downloads.get(filename)
+        if download is not None and download.error is None and not download.cancelled:
+            if pinned:
+                download.pinned = True
+            if not background:
+                download.background = False
+            elif download.throttle is None:
+                # Keep it for the offline sync once the player stops reading it
+                download.throttle = throttle
+            return download
+
+        previous = download
+        download = _downloads[filename] = Download(filename, url, background, throttle, pinned)
+        if previous is not None and not previous.done:
+            download._previous = previous
+        download.start()
+        return download
+
+
+def discard_download(filename):
+    """
+    Forget the download of *filename* if it failed, so the next request starts over.
+    """
+    with _lock:
+        download = _downloads.get(filename)
+        if download is not None and download.error is not None:
+            del _downloads[filename]
+
+
+def is_foreground_active():
+    """
+    Return ``True`` if a download the player is waiting for is running.
+    """
+    with _lock:
+        return any(not download.background and not download.done
+                   for download in _downloads.values())
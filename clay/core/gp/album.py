@@ -29,13 +29,14 @@ class Album(object):
         self._id = data['albumId']
         self._original_data = data
         self._tracks = None
+        self._table = None
+        self._rows = []
         self.icon = '\U0001F3B6'
         self.album_url = data.get('albumArtRef', "")
         self.artist = artist
         self.explicit_rating = int(data.get('explictType', 0))
         self.name = data['name']
         self.year = int(data.get('year', 1970))
-        self.sorted = False
 
     def __str__(self):
         return self.name
@@ -43,14 +44,21 @@ class Album(object):
     def __lt__(self, other):
         return self.name < other.name
 
-    def add_track(self, track):
+    @property
+    def id(self):
         """
-        Adds an track to the album
+        Album ID.
         """
-        if self._tracks is None:
-            self._tracks = []
+        return self._id
 
-        self._tracks.append(track)
+    def set_rows(self, table, rows):
+        """
+        Set the tracks of this album to the rows of the :class:`.LibraryTable`, ordered by
+        track number. The :class:`.Track` instances are only created once they are displayed.
+        """
+        self._table = table
+        self._rows = rows
+        self._tracks = None
 
     @property
     def tracks(self):
@@ -61,12 +69,13 @@ class Album(object):
           Returns the tracks associated with this album
         """
         if self._tracks is None:
-            self._tracks = Track.from_data(client.gp.get_album_tracks(self._id),
-                                           Source.album,
-                                           many=True)
-        if not self.sorted:
-            self._tracks.sort(key=lambda track: track.track_number)
-            self.sorted = True
+            if self._table is not None:
+                self._tracks = self._table.view(self._rows)
+            else:
+                self._tracks = Track.from_data(client.gp.get_album_tracks(self._id),
+                                               Source.album,
+                                               many=True)
+                self._tracks.sort(key=lambda track: track.track_number)
 
         return self._tracks
 
@@ -75,25 +84,34 @@ class AllSongs(Album):
     """
     A model representing all songs by an artist
     """
-    def __init__(self, artist, albums):
+    def __init__(self, artist):
         self._id = 'ALL'
-        self._albums = albums
         self.artist = artist
         self.icon = '\u224C'
         self.year = 2018   # TODO
         self.album_url = None  # TODO
         self.name = "All Songs"
+        self._table = None
+        self._rows = []
         self._tracks = None
         self.refresh = False
-        self.sorted = True
 
     @property
     def tracks(self):
-        # Could this be done faster?
+        """
+        The tracks of the store albums of the artist followed by its library tracks.
+        Artists that aren't in the library (e.g. found by searching) list the tracks of
+        their library albums instead.
+        """
         if self._tracks is None or self.refresh:
             tracks = []
-            for album in self._albums:
+            for album in self.artist._store_albums:
                 tracks += album.tracks
+            if self._table is not None:
+                tracks += self._table.view(self._rows)
+            else:
+                for album in self.artist._library_albums:
+                    tracks += album.tracks
             self._tracks = tracks
             self.refresh = False
         return self._tracks
@@ -111,4 +129,3 @@ class TopSongs(Album):
         self.year = 2018  # TODO
         self.album_url = None  # TODO
         self.name = "Top Songs"
-        self.sorted = True
@@ -32,7 +32,7 @@ class Artist(object):
         self._original_data = None
         self._store_albums = []
         self._library_albums = []
-        self._special_albums = [AllSongs(self, chain(self._store_albums, self._library_albums)), None]
+        self._special_albums = [AllSongs(self), None]
         self.name = name
 
     def __str__(self):
@@ -41,17 +41,17 @@ class Artist(object):
     def __lt__(self, other):
         return self.name < other.name
 
-    def add_album(self, album):
+    def set_library_albums(self, albums, table, rows):
         """
-        Adds a library added album to the artist.
+        Set the library added albums of the artist.
 
         Args:
-            album (`clay.gp.Album`): The album you want add
+            albums (`list`): The albums, ordered by name
+            table (`clay.gp.LibraryTable`): The library table
+            rows (`list`): The rows of all songs by the artist in *table*
         """
-        if album in self._library_albums:
-            return
-
-        self._library_albums.append(album)
+        self._library_albums = albums
+        self._special_albums[0].set_rows(table, rows)
 
     def load_store_albums(self):
         """
@@ -67,7 +67,7 @@ class Artist(object):
 
         self._store_albums = [Album(self, album) for album in self._original_data['albums']]
         self._store_albums.sort()
-        self._all_songs.refresh = True
+        self._special_albums[0].refresh = True
 
     @property
     def albums(self):
@@ -0,0 +1,283 @@
+# This file is part of Clay.
+# Copyright (C) 2018, Andrew Dunbai & Clay Contributors
+#
+# Clay is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Clay is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Clay. If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains the artist, album and genre catalog of the Google Play Music library
+"""
+from .album import Album
+from .artist import Artist
+
+
+#: The artist credited with albums whose tracks are by different artists
+VARIOUS_ARTISTS = 'Various Artists'
+
+
+class Catalog(object):
+    """
+    Artist, album and genre indices of a :class:`.LibraryTable`, built in a single pass.
+
+    Artists and albums are keyed by their Google Play Music IDs. Artists without an ID
+    (e.g. uploaded ones) are keyed by the ID of another row with the same name, or else by
+    their lowercase name. Albums without an ID are grouped by artist and name.
+    :attr:`artists` and :attr:`albums` are ordered by name and the tracks of every
+    album are ordered by track number.
+
+    After rows of the table were merged, :meth:`update` only patches the artists, albums
+    and genres of those rows. The public dicts and the row lists handed to albums and
+    artists are replaced rather than modified, so readers on other threads never see
+    them change.
+    """
+    def __init__(self, table):
+        self.table = table
+        #: Artist key -> :class:`.Artist`
+        self.artists = {}
+        #: Album key -> :class:`.Album`
+        self.albums = {}
+        #: Genre -> row indexes
+        self.genres = {}
+        #: Row indexes of the uploaded songs that the user liked
+        self.liked_rows = []
+
+        # Lowercase artist name -> first artist ID seen with it
+        self._name_ids = {}
+        # Artist key -> (artist ID, name)
+        self._artist_names = {}
+        # Artist key -> album key -> rows by the artist, ordered by track number
+        self._artist_rows = {}
+        # Album key -> name
+        self._album_names = {}
+        # Album key -> rows, ordered by track number
+        self._album_rows = {}
+        # Album keys credited to Various Artists because their track artists differ
+        self._compilations = set()
+        # The artist key, album key and genre of every row, None for removed rows
+        self._row_artists = []
+        self._row_albums = []
+        self._row_genres = []
+
+        self._finish(*self._add_rows(self.table.live_rows()))
+
+    def update(self, indexes):
+        """
+        Update the indices after the rows at *indexes* were replaced, added or removed.
+        """
+        self.genres = dict(self.genres)
+        artist_keys, album_keys = self._remove_rows(indexes)
+        live = [index for index in indexes if not self.table.is_deleted(index)]
+        added_artist_keys, added_album_keys = self._add_rows(live)
+        self._finish(artist_keys | added_artist_keys, album_keys | added_album_keys)
+
+    def _remove_rows(self, indexes):
+        """
+        Remove the rows at *indexes* from the indices, as they were when they were added.
+        Returns the keys of the artists and albums that lost rows.
+        """
+        removed = set(indexes)
+        artist_keys = set()
+        album_keys = set()
+        genres = set()
+        for index in indexes:
+            if index >= len(self._row_artists) or self._row_artists[index] is None:
+                continue
+            artist_keys.add(self._row_artists[index])
+            album_keys.add(self._row_albums[index])
+            genres.add(self._row_genres[index])
+            self._row_artists[index] = self._row_albums[index] = self._row_genres[index] = None
+
+        for artist_key in artist_keys:
+            albums = self._artist_rows[artist_key]
+            for album_key in album_keys.intersection(albums):
+                rows = [index for index in albums[album_key] if index not in removed]
+                if rows:
+                    albums[album_key] = rows
+                else:
+                    del albums[album_key]
+        for album_key in album_keys:
+            self._album_rows[album_key] = [index for index in self._album_rows[album_key]
+                                           if index not in removed]
+        for genre in genres:
+            rows = [index for index in self.genres[genre] if index not in removed]
+            if rows:
+                self.genres[genre] = rows
+            else:
+                del self.genres[genre]
+        self.liked_rows = [index for index in self.liked_rows if index not in removed]
+
+        return artist_keys, album_keys
+
+    def _add_rows(self, indexes):
+        """
+        Add the rows at *indexes* to the indices.
+        Returns the keys of the artists and albums that got rows.
+        """
+        columns = self.table.columns
+        artist_ids, artists, album_artists = \
+            columns['artist_id'], columns['artist'], columns['album_artist_name']
+        album_ids, album_names, genres = \
+            columns['album_id'], columns['album_name'], columns['genre']
+        store_ids, last_rating_changes = columns['store_id'], columns['last_rating_change']
+
+        missing = len(self.table) - len(self._row_artists)
+        for row_keys in (self._row_artists, self._row_albums, self._row_genres):
+            row_keys.extend([None] * missing)
+
+        # Artist ID or lowercase name -> (artist ID, name)
+        names = {}
+        # (artist ID or lowercase name, album key) -> row indexes
+        groups = {}
+        genre_rows = {}
+        liked_rows = []
+
+        for index in indexes:
+            artist_id, artist, album_artist = \
+                artist_ids[index], artists[index], album_artists[index]
+            album_id, album, genre = album_ids[index], album_names[index], genres[index]
+
+            name = album_artist or artist or 'Unknown Artist'
+            lname = name.lower()
+            # The artist ID belongs to the track artist, not to the album artist
+            if not artist_id or album_artist not in ('', artist):
+                artist_id = None
+            else:
+                self._name_ids.setdefault(lname, artist_id)
+            artist_key = artist_id or lname
+            names.setdefault(artist_key, (artist_id, name))
+
+            if album:
+                album_key = album_id or (lname, album)
+            else:
+                album_key = (lname, None)
+            self._album_names.setdefault(album_key, album or 'Unknown Album')
+
+            groups.setdefault((artist_key, album_key), []).append(index)
+            genre_rows.setdefault(genre, []).append(index)
+            self._row_albums[index] = album_key
+            self._row_genres[index] = genre
+
+            # Songs that are uploaded are not send in the promoted_songs
+            # call so we need to manually add them.
+            if store_ids[index] is None and last_rating_changes[index] is not None:
+                liked_rows.append(index)
+
+        for genre, rows in genre_rows.items():
+            self.genres[genre] = sorted(self.genres.get(genre, []) + rows)
+        if liked_rows:
+            self.liked_rows = sorted(self.liked_rows + liked_rows)
+
+        # Merge the artists without an ID into the artist with the same name that has one
+        artist_keys = set()
+        album_keys = set()
+        for (artist_key, album_key), rows in groups.items():
+            artist_id, name = names[artist_key]
+            artist_id = artist_id or self._name_ids.get(artist_key)
+            artist_key = artist_id or artist_key
+            self._artist_names.setdefault(artist_key, (artist_id, name))
+            albums = self._artist_rows.setdefault(artist_key, {})
+            albums[album_key] = albums.get(album_key, []) + rows
+            self._album_rows[album_key] = self._album_rows.get(album_key, []) + rows
+            for index in rows:
+                self._row_artists[index] = artist_key
+            artist_keys.add(artist_key)
+            album_keys.add(album_key)
+
+        return artist_keys, album_keys
+
+    def _finish(self, artist_keys, album_keys):
+        """
+        Order the rows of the changed artists and albums, credit the albums to their
+        artists and create or update their :class:`.Artist` and :class:`.Album` instances.
+        """
+        track_numbers = self.table.columns['track_number']
+        # Rows with the same track number keep the order of the table
+        by_track_number = lambda index: (track_numbers[index], index)
+        album_artists = self.table.columns['album_artist_name']
+        various_key = self._name_ids.get(VARIOUS_ARTISTS.lower(), VARIOUS_ARTISTS.lower())
+
+        for album_key in album_keys:
+            rows = sorted(self._album_rows[album_key], key=by_track_number)
+            self._album_rows[album_key] = rows
+            for artist_key in {self._row_artists[index] for index in rows}:
+                albums = self._artist_rows[artist_key]
+                albums[album_key] = sorted(albums[album_key], key=by_track_number)
+
+            if album_key in self._compilations:
+                self._compilations.discard(album_key)
+                del self._artist_rows[various_key][album_key]
+                artist_keys.add(various_key)
+
+        # Credit every album to its album artist, or to Various Artists if the
+        # tracks are by different artists and none of them names an album artist
+        credits = {}
+        for album_key in album_keys:
+            rows = self._album_rows[album_key]
+            if not rows:
+                continue
+            # The rows that name the album artist are keyed by it
+            credit = next((self._row_artists[index] for index in rows
+                           if album_artists[index]), None)
+            row_artists = {self._row_artists[index] for index in rows}
+            if credit is not None:
+                credits[album_key] = credit
+            elif len(row_artists) == 1:
+                credits[album_key] = row_artists.pop()
+            else:
+                credits[album_key] = various_key
+                self._compilations.add(album_key)
+                self._artist_names.setdefault(various_key, (None, VARIOUS_ARTISTS))
+                self._artist_rows.setdefault(various_key, {})[album_key] = rows
+                artist_keys.add(various_key)
+
+        artists = dict(self.artists)
+        for artist_key in artist_keys:
+            if self._artist_rows.get(artist_key):
+                if artist_key not in artists:
+                    artists[artist_key] = Artist(*self._artist_names[artist_key])
+            else:
+                self._artist_rows.pop(artist_key, None)
+                self._artist_names.pop(artist_key, None)
+                artists.pop(artist_key, None)
+
+        albums = dict(self.albums)
+        for album_key in album_keys:
+            rows = self._album_rows[album_key]
+            if not rows:
+                del self._album_rows[album_key]
+                del self._album_names[album_key]
+                albums.pop(album_key, None)
+                continue
+            album = albums.get(album_key)
+            if album is None:
+                name = self._album_names[album_key]
+                album = albums[album_key] = Album(artists[credits[album_key]], {
+                    'albumId': album_key if isinstance(album_key, str) else name,
+                    'name': name
+                })
+            album.artist = artists[credits[album_key]]
+            album.set_rows(self.table, rows)
+
+        for artist_key in artist_keys:
+            artist_albums = self._artist_rows.get(artist_key)
+            if not artist_albums:
+                continue
+            keys = sorted(artist_albums, key=lambda album_key: albums[album_key].name)
+            # Only the rows by this artist, not the whole album
+            artists[artist_key].set_library_albums(
+                [albums[album_key] for album_key in keys],
+                self.table,
+                [index for album_key in keys for index in artist_albums[album_key]]
+            )
+
+        self.artists = dict(sorted(artists.items(), key=lambda item: item[1].name))
+        self.albums = dict(sorted(albums.items(), key=lambda item: item[1].name))
@@ -17,17 +17,19 @@
 This file contains the classes and methods for dealing with Google Play Playlists
 """
 from __future__ import print_function
-from gmusicapi.clients import Mobileclient
+from threading import Lock
+
 from clay.core import EventHook
 from clay.core.log import logger
 
-from .artist import Artist
-from .album import Album
-from .track import Track
+from .catalog import Catalog
+from .library import LibraryTable
 from .playlist import Playlist, LikedSongs
 from .station import Station, IFLStation
 from .search import SearchResults
-from .utils import synchronized, asynchronous, Source
+from .snapshot import LibrarySnapshot
+from .stream_urls import StreamUrlCache
+from .utils import synchronized, asynchronous, single_flight, SingleFlight, Priority
 
 
 class _GP(object):
@@ -35,6 +37,9 @@ class _GP(object):
     Interface to :class:`gmusicapi.Mobileclient`. Implements
     asynchronous API calls, caching and some other perks.
 
+    Concurrent identical read-only calls share one request,
+    see :meth:`.get_coalesced_calls`.
+
     Singleton.
     """
     # TODO: Switch to urwid signals for more explicitness?
@@ -43,10 +48,8 @@ class _GP(object):
 
     def __init__(self):
         # self.is_debug = os.getenv('CLAY_DEBUG')
-        self.mobile_client = Mobileclient()
-        self.mobile_client._make_call = self._make_call_proxy(
-            self.mobile_client._make_call
-        )
+        self._mobile_client = None
+        self._mobile_client_lock = Lock()
         # if self.is_debug:
         #     self.debug_file = open('/tmp/clay-api-log.json', 'w')
         #     self._last_call_index = 0
@@ -55,12 +58,34 @@ class _GP(object):
         self.cached_stations = None
         self.cached_artists = {}
         self.cached_albums = {}
+        self.cached_genres = {}
+        self.catalog = None
         self.liked_songs = LikedSongs()
+        self.library_snapshot = LibrarySnapshot()
+        self.single_flight = SingleFlight()
+        self.stream_urls = StreamUrlCache()
 
         self.invalidate_caches()
 
         self.auth_state_changed = EventHook()
 
+    @property
+    def mobile_client(self):
+        """
+        Return the :class:`gmusicapi.Mobileclient`.
+
+        gmusicapi (with requests, oauth2client and protobuf) takes long to import,
+        so it is imported when the client is needed for the first time.
+        """
+        with self._mobile_client_lock:
+            if self._mobile_client is None:
+                from gmusicapi.clients import Mobileclient
+
+                mobile_client = Mobileclient()
+                mobile_client._make_call = self._make_call_proxy(mobile_client._make_call)
+                self._mobile_client = mobile_client
+            return self._mobile_client
+
     def _make_call_proxy(self, func):
         """
         Return a function that wraps *fn* and logs args & return values.
@@ -102,6 +127,9 @@ class _GP(object):
         Log in into Google Play Music.
         """
         self.mobile_client.logout()
+        # The snapshot is only kept if this is the account it was stored for
+        self.library_snapshot.set_account(email.lower())
+        self.stream_urls.clear()
         self.invalidate_caches()
         result = self.mobile_client.login(email, password, device_id)
         # prev_auth_state = self.is_authenticated
@@ -111,6 +139,7 @@ class _GP(object):
 
     login_async = asynchronous(login)
 
+    @single_flight
     @synchronized
     def get_artist_info(self, artist_id):
         """
@@ -118,6 +147,7 @@ class _GP(object):
         """
         return self.mobile_client.get_artist_info(artist_id, max_rel_artist=0, max_top_tracks=15)
 
+    @single_flight
     @synchronized
     def get_album_tracks(self, album_id):
         """
@@ -125,46 +155,6 @@ class _GP(object):
         """
         return self.mobile_client.get_album_info(album_id, include_tracks=True)['tracks']
 
-    @synchronized
-    def add_album_song(self, id_, album_name, track):
-        """
-        Adds an album to an artist and adds the specified track to it
-
-        Args:
-            id_ (`str`): the album ID (currently the same as the album title)
-            album_name (`str`): the name of the album
-            track (`clay.gp.Track`): the track in the album
-        """
-        if album_name == '':
-            id_ = track.artist
-            album_name = "Unknown Album"
-
-        if id_ not in self.cached_albums:
-            self.cached_albums[id_] = Album(
-                track.album_artist, {'albumId': id_, 'name': album_name})
-
-        self.cached_albums[id_].add_track(track)
-
-        return self.cached_albums[id_]
-
-    @synchronized
-    def add_artist(self, artist_id, name):
-        """
-        Creates or lookup an artist object and return it.
-
-        Args:
-           artist_id (`str`): The Artist id given by Google Play Music
-
-        Returns:
-           The artist class
-        """
-        name = ("Unknown Artist" if name == '' else name)
-        lname = name.lower()
-        if lname not in self.cached_artists:
-            self.cached_artists[lname] = Artist(artist_id, name)
-
-        return self.cached_artists[lname]
-
     @synchronized
     def use_authtoken(self, authtoken, device_id):
         """
@@ -191,28 +181,106 @@ class _GP(object):
         """
         return self.mobile_client.session._authtoken
 
+    @single_flight
     @synchronized
     def get_all_tracks(self):
         """
         Cache and return all tracks from "My library".
 
         Each track will have "id" and "storeId" keys.
+
+        If a library snapshot is stored on disk the tracks are read from it
+        and the changes made since then are fetched in the background,
+        see :meth:`.sync_library`.
         """
         if self.cached_tracks:
             return self.cached_tracks
+
+        data = self.library_snapshot.load()
+        if data:
+            self._load_tracks(data)
+            self.sync_library_async(callback=None, priority=Priority.low)
+            return self.cached_tracks
+
         data = self.mobile_client.get_all_songs()
-        self.cached_tracks = Track.from_data(data, Source.library, True)
-        self.parsed_songs.fire()
+        self.library_snapshot.replace(data)
+        self._load_tracks(data)
 
         return self.cached_tracks
 
     get_all_tracks_async = asynchronous(get_all_tracks)
 
-    def get_stream_url(self, stream_id):
+    def _load_tracks(self, data):
+        """
+        Parse the song dicts in *data* into the library table.
+        """
+        self.cached_tracks = LibraryTable.from_data(data)
+        self._build_catalog()
+        self.parsed_songs.fire(self.cached_tracks)
+
+    def _build_catalog(self):
+        """
+        (Re)build the cached artists, albums and genres from the library table.
+        """
+        self.catalog = Catalog(self.cached_tracks)
+        self._use_catalog()
+
+    def _use_catalog(self):
+        """
+        Publish the indices of :attr:`catalog` and add the liked uploaded songs.
+        """
+        self.cached_artists = self.catalog.artists
+        self.cached_albums = self.catalog.albums
+        self.cached_genres = self.catalog.genres
+
+        self.liked_songs.clear_uploaded_songs()
+        for index in self.catalog.liked_rows:
+            self.liked_songs.add_liked_song(self.cached_tracks[index])
+
+    @synchronized
+    def sync_library(self):
+        """
+        Fetch the songs that changed since the library snapshot was taken
+        and merge them into the cached tracks.
+
+        Only the catalog entries of the changed songs are updated.
+        Fires :attr:`.parsed_songs` with the changed tracks only and returns them.
+        """
+        updated_after = self.library_snapshot.updated_after
+        if updated_after is None or self.cached_tracks is None:
+            return []
+
+        data = self.mobile_client.get_all_songs(updated_after=updated_after, include_deleted=True)
+        if not data:
+            return []
+
+        self.library_snapshot.merge(data)
+        rows = self.cached_tracks.merge(data)
+        self.catalog.update(rows)
+        self._use_catalog()
+        changed_tracks = self.cached_tracks.view(rows)
+        self.parsed_songs.fire(changed_tracks)
+
+        return changed_tracks
+
+    sync_library_async = asynchronous(sync_library)
+
+    @single_flight
+    def get_stream_url(self, stream_id, refresh=False):
         """
         Returns playable stream URL of track by id.
+
+        URLs are cached until shortly before they expire,
+        pass *refresh* to fetch a new one anyway.
         """
-        return self.mobile_client.get_stream_url(stream_id)
+        if not refresh:
+            url = self.stream_urls.get(stream_id)
+            if url is not None:
+                return url
+
+        url = self.mobile_client.get_stream_url(stream_id)
+        self.stream_urls.put(stream_id, url)
+        return url
 
     get_stream_url_async = asynchronous(get_stream_url)
 
@@ -230,6 +298,7 @@ class _GP(object):
 
     increment_song_playcount_async = asynchronous(increment_song_playcount)
 
+    @single_flight
     @synchronized
     def get_all_user_station_contents(self, **_):
         """
@@ -250,6 +319,7 @@ class _GP(object):
         asynchronous(get_all_user_station_contents)
     )
 
+    @single_flight
     @synchronized
     def get_all_user_playlist_contents(self, **_):
         """
@@ -283,20 +353,23 @@ class _GP(object):
 
     def get_cached_tracks_map(self):
         """
-        Return a dictionary of tracks where keys are strings with track IDs
-        and values are :class:`.Track` instances.
+        Return a mapping of tracks where keys are strings with track IDs
+        (library id, nid and store id) and values are :class:`.Track` instances.
         """
-        return {track.id: track for track in self.cached_tracks}
+        return self.cached_tracks.get_tracks_map()
 
     def get_track_by_id(self, any_id):
         """
-        Return track by id or store_id.
+        Return library track by id, nid or store_id (``str`` or :class:`uuid.UUID`).
         """
-        for track in self.cached_tracks:
-            if any_id in (track.id_, track.nid, track.store_id):
-                return track
-        return None
+        if any_id is None or self.cached_tracks is None:
+            return None
+        index = self.cached_tracks.index_of(str(any_id))
+        if index is None:
+            return None
+        return self.cached_tracks[index]
 
+    @single_flight
     def search(self, query):
         """
         Find tracks and return an instance of :class:`.SearchResults`.
@@ -312,7 +385,7 @@ class _GP(object):
         """
         result = self.mobile_client.add_store_tracks(track.id)
         if result:
-            self.invalidate_caches()
+            self._library_changed()
         return result
 
     def remove_from_my_library(self, track):
@@ -321,14 +394,33 @@ class _GP(object):
         """
         result = self.mobile_client.delete_songs(track.id)
         if result:
-            self.invalidate_caches()
+            self._library_changed()
         return result
 
+    def _library_changed(self):
+        """
+        Bring the cached tracks up to date after the library was modified.
+        """
+        if self.cached_tracks is None or self.library_snapshot.updated_after is None:
+            self.invalidate_caches()
+        else:
+            self.sync_library()
+
+    def get_coalesced_calls(self):
+        """
+        Return a dict with the number of calls per method that were served
+        by an identical call that was already in flight.
+        """
+        return dict(self.single_flight.coalesced)
+
     @property
     def is_authenticated(self):
         """
         Return True if user is authenticated on Google Play Music, false otherwise.
         """
+        # Nobody could have logged in without the client
+        if self._mobile_client is None:
+            return False
         return self.mobile_client.is_authenticated()
 
     @property
@@ -336,6 +428,8 @@ class _GP(object):
         """
         Return True if user is subscribed on Google Play Music, false otherwise.
         """
+        if self._mobile_client is None:
+            return False
         return self.mobile_client.is_subscribed
 
 
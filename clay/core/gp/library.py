@@ -0,0 +1,372 @@
+# This file is part of Clay.
+# Copyright (C) 2018, Andrew Dunbai & Clay Contributors
+#
+# Clay is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Clay is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Clay. If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains the columnar in-memory table of the Google Play Music library
+"""
+from array import array
+from bisect import bisect_right
+from collections.abc import Mapping, Sequence
+from sys import intern
+from threading import Lock
+
+from clay.core.log import logger
+from .track import Track
+from .utils import Source
+
+#: Columns holding strings, in the order :func:`parse_song` returns them
+STRING_COLUMNS = (
+    'id_', 'nid', 'store_id', 'title', 'artist', 'album_name', 'album_artist_name',
+    'album_id', 'artist_id', 'genre', 'album_url', 'artist_art_url', 'last_rating_change'
+)
+#: Columns holding integers, stored in :class:`array.array`
+INT_COLUMNS = ('track_number', 'duration', 'rating', 'explicit_rating', 'play_count')
+COLUMNS = STRING_COLUMNS + INT_COLUMNS
+#: Columns whose values are shared between a lot of rows
+_INTERNED_COLUMNS = frozenset(['artist', 'album_name', 'album_artist_name', 'album_id',
+                               'artist_id', 'genre'])
+
+
+def parse_song(data):
+    """
+    Parse a song dict from the Google Play Music API into a row tuple,
+    see :data:`.COLUMNS` for the order of the fields.
+    """
+    artist_art_ref = next(iter(sorted(
+        data.get('artistArtRef', []),
+        key=lambda x: x['aspectRatio']
+    )), None)
+    artist_ids = data.get('artistId')
+
+    return (
+        data['id'],
+        data.get('nid'),
+        data.get('storeId'),
+        data['title'],
+        data['artist'],
+        data.get('album', ''),
+        data.get('albumArtist', ''),
+        data.get('albumId', ''),
+        artist_ids[0] if artist_ids else None,
+        data.get('genre', ''),
+        data['albumArtRef'][0]['url'] if 'albumArtRef' in data else '',
+        artist_art_ref['url'] if artist_art_ref is not None else '',
+        data.get('lastRatingChangeTimestamp'),
+        int(data['trackNumber']),
+        int(data['durationMillis']),
+        int(data.get('rating', 0)),
+        int(data.get('explicitType', 0)),
+        int(data.get('playCount', 0)),
+    )
+
+
+def parse_songs(data):
+    """
+    Parse a list of song dicts into a list of row tuples, skipping the songs that fail to parse.
+    """
+    rows = []
+    for song in data:
+        try:
+            rows.append(parse_song(song))
+        except Exception as error:
+            logger.error('Failed to parse track data: %s, failing data: %s', repr(error), song)
+    return rows
+
+
+class LibraryTable(Sequence):
+    """
+    Stores "My library" as columns instead of one :class:`.Track` per song.
+
+    Behaves like a list of tracks: the :class:`.Track` instance for a row
+    is only created once the row is accessed and is then kept.
+    Sorting, filtering and aggregations can be done on the columns
+    without creating any :class:`.Track` instances.
+    """
+    def __init__(self, rows=()):
+        self.columns = {}
+        # Serializes the creation of tracks, so every row has a single Track instance
+        self._track_lock = Lock()
+        self._tracks = []
+        self._index = {}
+        self._deleted = set()
+        self.clear()
+        self.extend(rows)
+
+    @classmethod
+    def from_data(cls, data):
+        """
+        Construct a table from a Google Play Music API response.
+        """
+        return cls(parse_songs(data))
+
+    def clear(self):
+        """
+        Remove all rows.
+        """
+        self.columns = {column: [] for column in STRING_COLUMNS}
+        self.columns.update({column: array('l') for column in INT_COLUMNS})
+        self._tracks = []
+        self._index = {}
+        self._deleted = set()
+
+    def extend(self, rows):
+        """
+        Append row tuples (as returned by :func:`parse_song`) to the table.
+        """
+        rows = list(rows)
+        start = len(self._tracks)
+
+        for position, name in enumerate(COLUMNS):
+            if name in _INTERNED_COLUMNS:
+                values = [intern(row[position]) if row[position] else row[position]
+                          for row in rows]
+            else:
+                values = [row[position] for row in rows]
+            self.columns[name].extend(values)
+
+            if name in ('id_', 'nid', 'store_id'):
+                self._index.update((id_, index) for index, id_ in enumerate(values, start) if id_)
+
+        self._tracks.extend([None] * len(rows))
+
+    def _index_row(self, index, row):
+        """
+        Make the row at *index* available by its library id, nid and store id.
+        """
+        for id_ in row[:3]:
+            if id_:
+                self._index[id_] = index
+
+    def _unindex_row(self, index):
+        """
+        Remove the row at *index* from the id index.
+        """
+        for column in ('id_', 'nid', 'store_id'):
+            id_ = self.columns[column][index]
+            if id_ and self._index.get(id_) == index:
+                del self._index[id_]
+
+    def merge(self, data):
+        """
+        Replace, add or remove rows according to the changed song dicts in *data*.
+        Returns the indexes of the replaced, added and removed rows,
+        :meth:`view` leaves the removed ones out.
+
+        Removed rows are kept as tombstones, see :meth:`is_deleted`, so the indexes of
+        the other rows and the views that were handed out before stay valid.
+        """
+        changed = set()
+
+        for song in data:
+            index = self._index.get(song['id'])
+            if song.get('deleted'):
+                if index is not None:
+                    self._unindex_row(index)
+                    self._deleted.add(index)
+                    changed.add(index)
+                continue
+
+            rows = parse_songs([song])
+            if not rows:
+                continue
+
+            if index is None:
+                changed.add(len(self._tracks))
+                self.extend(rows)
+                continue
+
+            self._unindex_row(index)
+            self._index_row(index, rows[0])
+            for name, value in zip(COLUMNS, rows[0]):
+                self.columns[name][index] = intern(value) \
+                    if value and name in _INTERNED_COLUMNS else value
+            self._tracks[index] = None
+            changed.add(index)
+
+        return sorted(changed)
+
+    def is_deleted(self, index):
+        """
+        Return ``True`` if the row at *index* was removed by :meth:`merge`.
+        """
+        return index in self._deleted
+
+    def live_rows(self):
+        """
+        Return the indexes of the rows that were not removed.
+        """
+        if not self._deleted:
+            return range(len(self))
+        return [index for index in range(len(self)) if index not in self._deleted]
+
+    def get_row(self, index):
+        """
+        Return the row tuple at *index*.
+        """
+        return tuple(self.columns[column][index] for column in COLUMNS)
+
+    def get_data(self, index):
+        """
+        Return the Google Play Music representation of the row at *index*.
+        """
+        columns = self.columns
+        data = {
+            'id': columns['id_'][index],
+            'nid': columns['nid'][index],
+            'storeId': columns['store_id'][index],
+            'title': columns['title'][index],
+            'artist': columns['artist'][index],
+            'album': columns['album_name'][index],
+            'albumArtist': columns['album_artist_name'][index],
+            'albumId': columns['album_id'][index],
+            'genre': columns['genre'][index],
+            'trackNumber': columns['track_number'][index],
+            'durationMillis': columns['duration'][index],
+            'rating': columns['rating'][index],
+            'explicitType': columns['explicit_rating'][index],
+            'playCount': columns['play_count'][index],
+            'lastRatingChangeTimestamp': columns['last_rating_change'][index],
+        }
+        if columns['artist_id'][index]:
+            data['artistId'] = [columns['artist_id'][index]]
+        if columns['album_url'][index]:
+            data['albumArtRef'] = [{'url': columns['album_url'][index]}]
+        if columns['artist_art_url'][index]:
+            data['artistArtRef'] = [{'url': columns['artist_art_url'][index], 'aspectRatio': '1'}]
+        return {key: value for key, value in data.items() if value is not None}
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        track = self._tracks[index]
+        if track is None:
+            with self._track_lock:
+                track = self._tracks[index]
+                if track is None:
+                    track = self._tracks[index] = Track(Source.library, self.get_data(index))
+        return track
+
+    def index_of(self, any_id):
+        """
+        Return the index of the row with library id, nid or store id *any_id*, ``None`` if
+        there is no such row.
+        """
+        return self._index.get(any_id)
+
+    def get_tracks_map(self):
+        """
+        Return a read-only mapping from every track identifier to its :class:`.Track`.
+        """
+        return _TracksMap(self)
+
+    def sorted_rows(self, column, reverse=False):
+        """
+        Return the indexes of the rows that were not removed, ordered by the values of *column*.
+        """
+        return sorted(self.live_rows(), key=self.columns[column].__getitem__, reverse=reverse)
+
+    def resort_rows(self, rows, column, changed):
+        """
+        Bring *rows*, ordered by *column* as by :meth:`sorted_rows`, up to date after a merge
+        without sorting them again: removed rows are dropped and the *changed* rows are
+        moved to their new place.
+        """
+        changed = set(changed)
+        values = self.columns[column]
+        rows = [index for index in rows if index not in changed and index not in self._deleted]
+        keys = [values[index] for index in rows]
+        for index in sorted(changed):
+            if index in self._deleted:
+                continue
+            position = bisect_right(keys, values[index])
+            keys.insert(position, values[index])
+            rows.insert(position, index)
+        return rows
+
+    def filter_rows(self, column, predicate):
+        """
+        Return the indexes of the rows for which *predicate* holds on the value of *column*.
+        """
+        values = self.columns[column]
+        return [index for index in self.live_rows() if predicate(values[index])]
+
+    def sum(self, column):
+        """
+        Return the sum of the integer *column*, e.g. the total duration of the library.
+        """
+        values = self.columns[column]
+        if not self._deleted:
+            return sum(values)
+        return sum(values[index] for index in self.live_rows())
+
+    def view(self, indexes):
+        """
+        Return a list-like view of the tracks at *indexes*, without the removed rows.
+
+        The view keeps showing the same rows when the table is merged later on,
+        rows that are removed then stay in it until a new view is made.
+        """
+        if self._deleted:
+            indexes = [index for index in indexes if index not in self._deleted]
+        return LibraryView(self, indexes)
+
+
+class LibraryView(Sequence):
+    """
+    A list-like selection of rows of a :class:`.LibraryTable`,
+    e.g. the sorted or filtered library.
+    """
+    def __init__(self, table, indexes):
+        self.table = table
+        self.indexes = indexes
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.table[i] for i in self.indexes[index]]
+        return self.table[self.indexes[index]]
+
+    def get_column(self, column):
+        """
+        Return the values of *column* for the rows of this view, without creating tracks.
+        """
+        values = self.table.columns[column]
+        return [values[index] for index in self.indexes]
+
+
+class _TracksMap(Mapping):
+    """
+    Read-only mapping from track identifiers to the tracks of a :class:`.LibraryTable`.
+    """
+    def __init__(self, table):
+        self._table = table
+
+    def __getitem__(self, key):
+        index = self._table.index_of(str(key))
+        if index is None:
+            raise KeyError(key)
+        return self._table[index]
+
+    def __iter__(self):
+        return iter(self._table._index)
+
+    def __len__(self):
+        return len(self._table._index)
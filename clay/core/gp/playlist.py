@@ -80,12 +80,18 @@ class LikedSongs(object):
         Return the tracks
         """
         if not self._sorted:
-            self._tracks.sort(key=lambda k: k.original_data.get('lastRatingChangeTimestamp', '0'),
+            self._tracks.sort(key=lambda k: k.last_rating_change or '0',
                               reverse=True)
             self._sorted = True
 
         return self._tracks
 
+    def clear_uploaded_songs(self):
+        """
+        Remove the uploaded songs from the liked songs playlist.
+        """
+        self._uploaded_tracks = []
+
     def add_liked_song(self, song):
         """
         Add an uploaded song the liked songs playlist
@@ -0,0 +1,188 @@
+# This file is part of Clay.
+# Copyright (C) 2018, Andrew Dunbai & Clay Contributors
+#
+# Clay is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Clay is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Clay. If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains the on-disk snapshot of the Google Play Music library
+"""
+import json
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from threading import Lock
+
+from clay.core.settings import settings_manager
+from clay.core.log import logger
+
+
+class LibrarySnapshot(object):
+    """
+    Stores the raw song dicts of "My library" in an SQLite database so the
+    library can be displayed before Google Play Music responds.
+
+    Also remembers the modification timestamp of the newest song so only
+    the songs that changed since then need to be fetched, and the account
+    the songs belong to, see :meth:`set_account`.
+    """
+    FILENAME = 'library.sqlite'
+
+    def __init__(self, path=None):
+        self._path = path or settings_manager.get_cache_path(self.FILENAME)
+        self._lock = Lock()
+
+        try:
+            with closing(self._connect()) as connection, connection:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS songs (id TEXT PRIMARY KEY, data TEXT NOT NULL)'
+                )
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)'
+                )
+        except sqlite3.DatabaseError as error:
+            logger.error('Failed to open library snapshot %s: %s', self._path, str(error))
+            self._path = None
+
+    def _connect(self):
+        """
+        Open a new connection, SQLite connections can't be shared between threads.
+        """
+        return sqlite3.connect(self._path)
+
+    @staticmethod
+    def _get_modified(song):
+        """
+        Return the modification timestamp of a song in microseconds.
+        """
+        return int(song.get('lastModifiedTimestamp', 0))
+
+    @property
+    def updated_after(self):
+        """
+        Return the (UTC) :class:`datetime.datetime` of the newest song in the snapshot,
+        ``None`` if the snapshot is empty.
+        """
+        if self._path is None:
+            return None
+
+        try:
+            with self._lock, closing(self._connect()) as connection:
+                row = connection.execute(
+                    "SELECT value FROM meta WHERE key = 'last_modified'"
+                ).fetchone()
+        except sqlite3.DatabaseError as error:
+            logger.error('Failed to read library snapshot: %s', str(error))
+            return None
+
+        if row is None:
+            return None
+        return datetime.utcfromtimestamp(int(row[0]) / 1e6)
+
+    def load(self):
+        """
+        Return a list of all stored song dicts.
+        """
+        if self._path is None:
+            return []
+
+        try:
+            with self._lock, closing(self._connect()) as connection:
+                rows = connection.execute('SELECT data FROM songs').fetchall()
+        except sqlite3.DatabaseError as error:
+            logger.error('Failed to read library snapshot: %s', str(error))
+            return []
+
+        return [json.loads(data) for (data,) in rows]
+
+    def replace(self, songs):
+        """
+        Replace the whole snapshot by *songs*.
+        """
+        self._write(songs, clear=True)
+
+    def merge(self, songs):
+        """
+        Insert or update *songs* and drop the ones marked as deleted.
+        """
+        self._write(songs, clear=False)
+
+    def clear(self):
+        """
+        Remove all songs from the snapshot.
+        """
+        self._write([], clear=True)
+
+    def set_account(self, account):
+        """
+        Remember that the snapshot belongs to *account*.
+        Clears the snapshot if it belonged to another account (or to an unknown one).
+        """
+        if self._path is None:
+            return
+
+        try:
+            with self._lock, closing(self._connect()) as connection, connection:
+                row = connection.execute(
+                    "SELECT value FROM meta WHERE key = 'account'"
+                ).fetchone()
+                if row is not None and row[0] == account:
+                    return
+
+                connection.execute('DELETE FROM songs')
+                connection.execute('DELETE FROM meta')
+                connection.execute(
+                    "INSERT INTO meta (key, value) VALUES ('account', ?)", (account,)
+                )
+        except sqlite3.DatabaseError as error:
+            # The songs may belong to another account, stop using the snapshot
+            logger.error('Failed to write library snapshot: %s', str(error))
+            self._path = None
+
+    def _write(self, songs, clear):
+        """
+        Write *songs* into the snapshot in a single transaction.
+        """
+        if self._path is None:
+            return
+
+        last_modified = max([self._get_modified(song) for song in songs] or [0])
+
+        try:
+            self._write_songs(songs, clear, last_modified)
+        except sqlite3.DatabaseError as error:
+            logger.error('Failed to write library snapshot: %s', str(error))
+
+    def _write_songs(self, songs, clear, last_modified):
+        """
+        Write *songs* and the timestamp of the newest one, see :meth:`_write`.
+        """
+        with self._lock, closing(self._connect()) as connection, connection:
+            if clear:
+                connection.execute('DELETE FROM songs')
+                connection.execute("DELETE FROM meta WHERE key != 'account'")
+
+            connection.executemany(
+                'DELETE FROM songs WHERE id = ?',
+                [(song['id'],) for song in songs if song.get('deleted')]
+            )
+            connection.executemany(
+                'INSERT OR REPLACE INTO songs (id, data) VALUES (?, ?)',
+                [(song['id'], json.dumps(song)) for song in songs if not song.get('deleted')]
+            )
+
+            if last_modified:
+                connection.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_modified', "
+                    "MAX(?, COALESCE((SELECT value FROM meta WHERE key = 'last_modified'), 0)))",
+                    (last_modified,)
+                )
@@ -0,0 +1,91 @@
+# This file is part of Clay.
+# Copyright (C) 2018, Andrew Dunbai & Clay Contributors
+#
+# Clay is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Clay is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Clay. If not, see <https://www.gnu.org/licenses/>.
+"""
+This file contains the cache of signed Google Play Music stream URLs
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+from urllib.parse import urlparse, parse_qs
+
+
+def get_url_expiry(url):
+    """
+    Return the UNIX timestamp at which the signed stream *url* expires,
+    ``None`` if the URL doesn't say.
+    """
+    try:
+        return int(parse_qs(urlparse(url).query)['expire'][0])
+    except (KeyError, ValueError):
+        return None
+
+
+class StreamUrlCache(object):
+    """
+    Remembers stream URLs until shortly before they expire.
+
+    The expiry is read from the ``expire`` query parameter of the signed URL,
+    URLs without one are kept for :attr:`DEFAULT_TTL` seconds.
+    """
+    #: Seconds a URL is kept if it doesn't contain its expiry
+    DEFAULT_TTL = 60
+    #: Seconds before the expiry at which a URL is no longer handed out,
+    #: so the player has time to open the stream
+    MARGIN = 15
+    #: Maximum number of URLs kept
+    MAX_SIZE = 64
+
+    def __init__(self):
+        self._urls = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, stream_id):
+        """
+        Return the cached URL for *stream_id*, ``None`` if there is none or it expires soon.
+        """
+        with self._lock:
+            url, expires = self._urls.get(stream_id, (None, 0))
+            if url is None:
+                return None
+            if expires - self.MARGIN <= time.time():
+                del self._urls[stream_id]
+                return None
+            return url
+
+    def put(self, stream_id, url):
+        """
+        Cache *url* for *stream_id*.
+        """
+        expires = get_url_expiry(url) or time.time() + self.DEFAULT_TTL
+        with self._lock:
+            self._urls.pop(stream_id, None)
+            self._urls[stream_id] = (url, expires)
+            while len(self._urls) > self.MAX_SIZE:
+                self._urls.popitem(last=False)
+
+    def invalidate(self, stream_id):
+        """
+        Forget the URL for *stream_id*, e.g. because the server refused it.
+        """
+        with self._lock:
+            self._urls.pop(stream_id, None)
+
+    def clear(self):
+        """
+        Forget all URLs.
+        """
+        with self._lock:
+            self._urls.clear()
@@ -16,26 +16,31 @@
 """
 This file contains the classes and functions for gmusic track
 """
-try:
-    from PIL import Image
-except ImportError:
-    Image = None
-
 from urllib.request import urlopen
 from io import BytesIO
 from hashlib import sha1
+from sys import intern
 from uuid import UUID
 
 from clay.core.settings import settings_manager
 from clay.core.log import logger
 from . import station, client
-from .utils import synchronized, asynchronous, Source
+from .utils import synchronized, asynchronous, Source, Priority
 
 
 class Track(object):
     """
     Model that represents single track from Google Play Music.
+
+    Only the fields Clay uses are kept, see :meth:`.to_data` for the API representation.
     """
+    __slots__ = (
+        'id_', 'nid', 'store_id', 'title', 'artist', 'genre', 'play_count',
+        'album_name', 'album_id', 'album_url', 'album_artist_name',
+        'track_number', 'duration', 'rating', 'explicit_rating', 'last_rating_change',
+        'artist_art_url', 'queue_id', 'source', 'cached_url'
+    )
+
     def __init__(self, source, data):
         # In playlist items and user uploaded songs the storeIds are missing so
         self.id_ = data.get('id')
@@ -56,48 +61,57 @@ class Track(object):
             key=lambda x: x['aspectRatio']
         )), None)
         self.title = data['title']
-        self.artist = data['artist']
-        self.genre = data.get('genre', '')
+        # Artist, album and genre names are shared by a lot of tracks
+        self.artist = intern(data['artist'])
+        self.genre = intern(data.get('genre', ''))
         self.play_count = data.get('playCount')
 
         # User uploaded songs miss a store_id
-        self.album_name = data.get('album', '')
-        self.album_id = data.get('albumId', '')
+        self.album_name = intern(data.get('album', ''))
+        self.album_id = intern(data.get('albumId', ''))
         self.album_url = (data['albumArtRef'][0]['url'] if 'albumArtRef' in data else "")
+        self.album_artist_name = intern(data.get('albumArtist', ''))
         self.track_number = data['trackNumber']
 
-        if source == Source.library:
-            name = (data['albumArtist'] if data['albumArtist'] != '' else self.artist)
-
-            if 'artistId' in data and data['artistId'] != "":
-                self.album_artist = client.gp.add_artist(data['artistId'][0], name)
-            else:
-                self.album_artist = client.gp.add_artist(None, name)
-
-            album = client.gp.add_album_song(self.album_name, self.album_name, self)
-            self.album_artist.add_album(album)
-
         self.duration = int(data['durationMillis'])
         self.rating = int(data.get('rating', 0))
         self.queue_id = None
         self.source = source
         self.cached_url = None
-        self.artist_art_url = ''
-        self.artist_art_filename = None
-
-        if artist_art_ref is not None:
-            self.artist_art_url = artist_art_ref['url']
-            self.artist_art_filename = sha1(
-                self.artist_art_url.encode('utf-8')
-            ).hexdigest() + u'.jpg'
+        self.artist_art_url = artist_art_ref['url'] if artist_art_ref is not None else ''
         self.explicit_rating = int(data.get('explicitType', 0))
+        self.last_rating_change = data.get('lastRatingChangeTimestamp')
 
         # Songs that are uploaded are not send in the promoted_songs
-        # call so we need to manually add them.
-        if self.store_id is None and 'lastRatingChangeTimestamp' in data:
+        # call so we need to manually add them. Library songs are added by the client.
+        if source != Source.library and self.store_id is None and \
+           self.last_rating_change is not None:
             client.gp.liked_songs.add_liked_song(self)
 
-        self.original_data = data
+    def to_data(self):
+        """
+        Reconstruct the Google Play Music representation of this track,
+        e.g. for :meth:`gmusicapi.Mobileclient.rate_songs`.
+        """
+        data = {
+            'kind': 'sj#track',
+            'id': self.id,
+            'nid': self.nid,
+            'storeId': self.store_id,
+            'title': self.title,
+            'artist': self.artist,
+            'album': self.album_name,
+            'albumArtist': self.album_artist_name,
+            'albumId': self.album_id,
+            'genre': self.genre,
+            'trackNumber': self.track_number,
+            'durationMillis': str(self.duration),
+            'playCount': self.play_count,
+            'rating': str(self.rating),
+            'explicitType': str(self.explicit_rating),
+            'lastRatingChangeTimestamp': self.last_rating_change
+        }
+        return {key: value for key, value in data.items() if value is not None and value != ''}
 
     @property
     def id(self):
@@ -113,6 +127,15 @@ class Track(object):
 
         return id_
 
+    @property
+    def artist_art_filename(self):
+        """
+        Return the filename for the artist art of this track, ``None`` if it doesn't have any.
+        """
+        if self.artist_art_url == '':
+            return None
+        return sha1(self.artist_art_url.encode('utf-8')).hexdigest() + u'.jpg'
+
     @property
     def filename(self):
         """
@@ -170,26 +193,31 @@ class Track(object):
         Returns:
            Nothing
         """
-        client.gp.increment_song_playcount_async(self.id, callback=callback)
+        client.gp.increment_song_playcount_async(self.id, callback=callback,
+                                                 priority=Priority.low)
 
-    def get_url(self, callback):
+    def get_url(self, callback, priority=Priority.high, refresh=False):
         """
         Gets playable stream URL for this track.
 
         "callback" is called with "(url, error)" args after URL is fetched.
+        Returns the :class:`concurrent.futures.Future` of the request.
 
-        Keep in mind this URL is valid for a limited time.
+        Keep in mind this URL is valid for a limited time, pass *refresh*
+        to skip the URL cache once the server refused a cached URL.
         """
         def on_get_url(url, error):
             """
             Called when URL is fetched.
             """
-            url = url.replace('https', 'http')
-            logger.debug(url)
-            self.cached_url = url
+            if url is not None:
+                url = url.replace('https', 'http')
+                logger.debug(url)
+                self.cached_url = url
             callback(url, error, self)
 
-        client.gp.get_stream_url_async(self.id, callback=on_get_url)
+        return client.gp.get_stream_url_async(self.id, refresh, callback=on_get_url,
+                                              priority=priority)
 
     @synchronized
     def get_artist_art_filename(self):
@@ -197,12 +225,18 @@ class Track(object):
         Return artist art filename, None if this track doesn't have any.
         Downloads if necessary.
         """
-        if self.artist_art_url == '':
+        filename = self.artist_art_filename
+        if filename is None:
             return None
 
-        if not settings_manager.get_is_file_cached(self.artist_art_filename):
+        if not settings_manager.get_is_file_cached(filename):
             response = urlopen(self.artist_art_url)
             data = response.read()
+            # Pillow is optional and slow to import, so it is imported on first use
+            try:
+                from PIL import Image
+            except ImportError:
+                Image = None
             if Image:
                 image = Image.open(BytesIO(data))
                 image.thumbnail((128, 128))
@@ -210,9 +244,9 @@ class Track(object):
                 image = image.convert('RGB')
                 image.save(out, format='JPEG')
                 data = out.getvalue()
-            settings_manager.save_file_to_cache(self.artist_art_filename, data)
+            settings_manager.save_file_to_cache(filename, data)
 
-        return settings_manager.get_cached_file_path(self.artist_art_filename)
+        return settings_manager.get_cached_file_path(filename)
 
     # get_artist_arg_filename_async = asynchronous(get_artist_art_filename)
 
@@ -253,11 +287,10 @@ class Track(object):
     def rate_song(self, rating):
         """
         Rate the song either 0 (no thumb), 1 (down thumb) or 5 (up thumb).
-        gp.mobile_client.rate_songs(self.original_data, rating)
+        gp.mobile_client.rate_songs(self.to_data(), rating)
         """
-        self.original_data['rating'] = rating
         self.rating = rating
-        client.gp.mobile_client.rate_songs(self.original_data, rating)
+        client.gp.mobile_client.rate_songs(self.to_data(), rating)
         client.gp.refresh_liked_songs()
 
     def __repr__(self):
@@ -16,8 +16,16 @@
 """
 This file contains classes and functions generally useful for Google Play Music
 """
-from enum import Enum
-from threading import Thread, Lock
+import heapq
+import inspect
+from collections import Counter
+from concurrent.futures import Future
+from enum import Enum, IntEnum
+from functools import wraps
+from itertools import count
+from threading import Thread, Lock, Condition
+
+from clay.core.log import logger
 
 
 class Type(Enum):
@@ -41,18 +49,105 @@ class Source(Enum):
     album = 'album'
 
 
+class Priority(IntEnum):
+    """
+    Priority of a job submitted to the :class:`.WorkerPool`, lower runs first.
+    """
+    high = 0  # Needed right now, e.g. the stream URL of the track that is about to play
+    normal = 1
+    low = 2  # Background work, e.g. prefetching
+
+
+class WorkerPool(object):
+    """
+    A bounded pool of worker threads that run jobs in order of their :class:`.Priority`.
+
+    Worker threads are started on demand up to *max_workers* and then reused.
+    """
+    def __init__(self, max_workers, name):
+        self.max_workers = max_workers
+        self.name = name
+        self._queue = []
+        self._counter = count()
+        self._condition = Condition()
+        self._workers = 0
+        self._idle = 0
+
+    def submit(self, priority, func, *args, **kwargs):
+        """
+        Schedule ``func(*args, **kwargs)`` and return a :class:`concurrent.futures.Future`.
+
+        Jobs that didn't start yet are dropped once their future is cancelled.
+        """
+        future = Future()
+        with self._condition:
+            heapq.heappush(self._queue, (priority, next(self._counter), future, func, args, kwargs))
+            # Idle workers may not have picked up the earlier jobs yet
+            if len(self._queue) > self._idle and self._workers < self.max_workers:
+                self._workers += 1
+                Thread(
+                    target=self._work,
+                    name='{}-{}'.format(self.name, self._workers),
+                    daemon=True
+                ).start()
+            else:
+                self._condition.notify()
+        return future
+
+    def _work(self):
+        """
+        Worker thread body.
+        """
+        while True:
+            with self._condition:
+                self._idle += 1
+                while not self._queue:
+                    self._condition.wait()
+                self._idle -= 1
+                _, _, future, func, args, kwargs = heapq.heappop(self._queue)
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as error:  # pylint: disable=broad-except
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+#: Runs the jobs of :func:`asynchronous` functions
+executor = WorkerPool(6, 'clay-worker')
+#: Reserved for :attr:`Priority.high` jobs so they never wait behind slow background work
+priority_executor = WorkerPool(2, 'clay-priority-worker')
+
+
+def submit(func, *args, priority=Priority.normal, **kwargs):
+    """
+    Run ``func(*args, **kwargs)`` on a worker thread, returns a
+    :class:`concurrent.futures.Future`.
+    """
+    pool = priority_executor if priority == Priority.high else executor
+    return pool.submit(priority, func, *args, **kwargs)
+
+
 def asynchronous(func):
     """
     Decorates a function to become asynchronous.
 
-    Once called, runs original function in a new Thread.
+    Once called, runs original function on the shared :class:`.WorkerPool`
+    and returns a :class:`concurrent.futures.Future`.
 
     Must be called with a 'callback' argument that will be called
-    once thread with original function finishes. Receives two args:
+    once the original function finishes. Receives two args:
     result and error.
 
     - "result" contains function return value or None if there was an exception.
     - "error" contains None or Exception if there was one.
+
+    An optional 'priority' argument (:class:`.Priority`) decides which jobs run first.
+    The callback is not called if the future is cancelled before the job starts.
     """
     def wrapper(*args, **kwargs):
         """
@@ -60,26 +155,39 @@ def asynchronous(func):
         """
         callback = kwargs.pop('callback')
         extra = kwargs.pop('extra', dict())
+        priority = kwargs.pop('priority', Priority.normal)
 
         if callback is None:
             callback = lambda *_, **__: None
 
         def process():
             """
-            Thread body.
+            Job body.
             """
             try:
                 result = func(*args, **kwargs)
             except Exception as error:
-                callback(None, error, **extra)
-            else:
-                callback(result, None, **extra)
+                _run_callback(callback, None, error, extra)
+                raise
+            _run_callback(callback, result, None, extra)
+            return result
 
-        Thread(target=process).start()
+        return submit(process, priority=priority)
 
     return wrapper
 
 
+def _run_callback(callback, result, error, extra):
+    """
+    Run the callback of an :func:`asynchronous` call, errors are logged
+    so they don't leak into the future of the call.
+    """
+    try:
+        callback(result, error, **extra)
+    except Exception as callback_error:  # pylint: disable=broad-except
+        logger.error('Callback %s failed: %s', callback, repr(callback_error))
+
+
 def synchronized(func):
     """
     Decorates a function to become thread-safe by preventing
@@ -89,6 +197,7 @@ def synchronized(func):
     """
     lock = Lock()
 
+    @wraps(func)
     def wrapper(*args, **kwargs):
         """
         Inner function.
@@ -101,3 +210,86 @@ def synchronized(func):
             lock.release()
 
     return wrapper
+
+
+class SingleFlight(object):
+    """
+    Lets concurrent identical calls share a single in-flight call.
+
+    The first caller for a key runs the call, callers that arrive while it is
+    running wait for it and receive the same result or exception.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._in_flight = {}
+        #: Function name -> number of calls that were started
+        self.started = Counter()
+        #: Function name -> number of calls that attached to an in-flight call
+        self.coalesced = Counter()
+
+    def call(self, key, func, *args, **kwargs):
+        """
+        Return ``func(*args, **kwargs)``, shared with concurrent calls for *key*.
+        The first item of *key* is used as the name in the counters.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                future.set_running_or_notify_cancel()
+                self.started[key[0]] += 1
+            else:
+                self.coalesced[key[0]] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as error:
+            self._finish(key)
+            future.set_exception(error)
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result
+
+    def _finish(self, key):
+        """
+        Let calls for *key* that start from now on run again.
+        """
+        with self._lock:
+            del self._in_flight[key]
+
+
+def single_flight(func):
+    """
+    Decorates a method so concurrent calls with the same arguments share one call,
+    see :class:`.SingleFlight`. The instance must have a ``single_flight`` attribute.
+
+    Arguments are bound to the signature with defaults applied, so ``f(x)``,
+    ``f(x, False)`` and ``f(x, refresh=False)`` share a call.
+    Calls with unhashable arguments are not shared.
+    """
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        """
+        Inner function.
+        """
+        try:
+            bound = signature.bind(self, *args, **kwargs)
+        except TypeError:
+            # Let the call raise the error
+            return func(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = (func.__name__, bound.args[1:], tuple(sorted(bound.kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return func(self, *args, **kwargs)
+        return self.single_flight.call(key, func, self, *args, **kwargs)
+
+    return wrapper
@@ -1,8 +1,10 @@
 """
 This module defines and starts a MPRIS2 dbus interface
+
+It is imported by :func:`start` once the UI is shown, pydbus takes long to import.
 """
+import os
 import sys
-import pkg_resources
 
 from pydbus import SessionBus, Variant
 from pydbus.generic import signal
@@ -21,6 +23,41 @@ class MPRIS2:
 
     def __init__(self):
         self._stopped = False
+        self.bus = None
+
+        player.queue_changed += self._queue_changed
+        player.track_appended += self._track_appended
+        player.track_removed += self._track_removed
+        player.seeked += self._seeked
+
+    def _queue_changed(self):
+        """
+        Called when the queue was loaded, cleared or shuffled.
+        """
+        current_track = player.queue.get_current_track()
+        self.TrackListReplaced.emit([track.queue_id for track in player.queue.get_tracks()],
+                                    current_track.queue_id if current_track else self.notrack)
+
+    def _track_appended(self, _):
+        """
+        Called when a track was appended to the queue.
+        """
+        tracks = player.queue.get_tracks()
+        self.TrackAdded.emit(self.get_metadata(tracks[-1]),
+                             tracks[-2].queue_id if len(tracks) > 1 else self.notrack)
+
+    def _track_removed(self, track):
+        """
+        Called when a track was removed from the queue.
+        """
+        if track.queue_id is not None:
+            self.TrackRemoved.emit(track.queue_id)
+
+    def _seeked(self, time):
+        """
+        Called when the player jumped to *time* (in microseconds).
+        """
+        self.Seeked.emit(time)
 
     @staticmethod
     def get_metadata(track):
@@ -163,7 +200,7 @@ class MPRIS2:
         """
         if self._stopped or player.queue.get_tracks() == []:
             return "Stopped"
-        elif player.playing:
+        elif player.state.playing:
             return "Playing"
         else:
             return "Paused"
@@ -210,15 +247,13 @@ class MPRIS2:
 
     @property
     def Metadata(self):
-        try:
-            track = player.get_current_track()
-        except AttributeError:
-            track = None
-
-        if track is None:
+        state = player.state
+        if state.track is None:
             return {}
 
-        return self.get_metadata(track)
+        metadata = self.get_metadata(state.track)
+        metadata['mpris:length'] = Variant('x', state.length)
+        return metadata
 
     @property
     def CanPause(self):
@@ -271,7 +306,7 @@ class MPRIS2:
 
     @property
     def Position(self):
-        return player.time
+        return player.state.time
 
     # The following are custom additions to the protocol for features that clay supports
     def Mute(self):
@@ -396,22 +431,30 @@ class MPRIS2:
 
 
 def load_xml(name):
-    return pkg_resources.resource_string(__name__, "mpris/org.mpris.MediaPlayer2" + name + ".xml")\
-        .decode("utf-8")
+    path = os.path.join(os.path.dirname(__file__), 'mpris',
+                        'org.mpris.MediaPlayer2' + name + '.xml')
+    with open(path, 'r') as xml_file:
+        return xml_file.read()
 
 
-bus = SessionBus()
 MPRIS2.dbus = [load_xml(file_)
                for file_ in ["", ".Player", ".TrackList", ".Playlists"]]
 mpris2_manager = MPRIS2()
 
-try:
-    bus.publish("org.mpris.MediaPlayer2.clay", mpris2_manager,
-                ('/org/mpris/MediaPlayer2', mpris2_manager),
-                ('/org/mpris/MediaPlayer2/Player', mpris2_manager),
-                ('/org/mpris/MediaPlayer2/TrackList', mpris2_manager))
 
-except RuntimeError as e:
-    logger.error(str(e))
-    logger.warn(
-        "An another instance of Clay is already running so we can't start MPRIS2")
+def start():
+    """
+    Publish :data:`mpris2_manager` on the session bus.
+    """
+    # Keep the connection open as long as Clay runs
+    bus = mpris2_manager.bus = SessionBus()
+    try:
+        bus.publish("org.mpris.MediaPlayer2.clay", mpris2_manager,
+                    ('/org/mpris/MediaPlayer2', mpris2_manager),
+                    ('/org/mpris/MediaPlayer2/Player', mpris2_manager),
+                    ('/org/mpris/MediaPlayer2/TrackList', mpris2_manager))
+
+    except RuntimeError as e:
+        logger.error(str(e))
+        logger.warn(
+            "An another instance of Clay is already running so we can't start MPRIS2")
@@ -0,0 +1,282 @@
+"""
+Keeps playlists, albums and stations available offline.
+"""
+from itertools import count
+from threading import Thread, Lock, Condition
+import heapq
+import json
+import os
+import time
+
+from .download import start_download, discard_download, is_foreground_active
+from .eventhook import EventHook
+from .gp import gp
+from .gp.album import Album
+from .gp.playlist import Playlist, LikedSongs
+from .gp.station import Station
+from .gp.utils import Priority, asynchronous
+from .log import logger
+from .settings import settings_manager
+
+
+def get_collection_key(item):
+    """
+    Return the key *item* is stored under when it is available offline,
+    ``None`` if *item* can't be made available offline.
+    """
+    if isinstance(item, Playlist):
+        return 'playlist:{}'.format(item.id)
+    if isinstance(item, LikedSongs):
+        return 'liked'
+    if isinstance(item, Album):
+        return 'album:{}:{}'.format(item.artist, item.id)
+    if isinstance(item, Station):
+        return 'station:{}'.format(item.id)
+    return None
+
+
+class _OfflineManager(object):
+    """
+    Downloads the tracks of the playlists, albums and stations that are marked as
+    available offline and pins them in the cache, so they are never evicted.
+
+    Tracks are downloaded by a few background workers, ordered by the priority of their
+    collection. Background downloads share the configured bandwidth and pause while
+    the player waits for a download. The marked collections are saved in the cache
+    directory, their missing tracks are downloaded once the user is logged in again.
+
+    Singleton.
+    """
+    FILENAME = 'offline.json'
+    #: Seconds between checks whether the player still waits for a download
+    PAUSE_INTERVAL = 0.25
+
+    def __init__(self):
+        #: Fired with the number of downloaded and of all offline tracks after every track
+        self.progress_changed = EventHook()
+        self._collections = {}
+        self._queue = []
+        self._queued = set()
+        self._counter = count()
+        self._workers = []
+        self._loaded = False
+        self._lock = Lock()
+        self._condition = Condition(self._lock)
+        self._throttle_lock = Lock()
+        self._next_chunk = 0
+
+        gp.auth_state_changed += self._auth_state_changed
+
+    def _auth_state_changed(self, is_auth):
+        """
+        Resume the downloads of the saved collections once the user is logged in.
+        """
+        if not is_auth:
+            return
+
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+        self._enqueue_missing()
+
+    def _load(self):
+        """
+        Read the saved collections.
+        """
+        try:
+            with open(settings_manager.get_cache_path(self.FILENAME)) as offline_file:
+                self._collections = json.load(offline_file)['collections']
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as error:
+            logger.error('Failed to load offline collections: %s', str(error))
+
+    def _save(self):
+        """
+        Write the collections atomically, the lock must be held.
+        """
+        path = settings_manager.get_cache_path(self.FILENAME)
+        with open(path + '.tmp', 'w') as offline_file:
+            json.dump({'collections': self._collections}, offline_file)
+        os.replace(path + '.tmp', path)
+
+    def is_marked(self, item):
+        """
+        Return ``True`` if *item* is available offline.
+        """
+        return get_collection_key(item) in self._collections
+
+    def mark(self, item, priority=Priority.normal):
+        """
+        Make *item* available offline and return the number of its tracks.
+        The tracks are taken from *item* now, marking it again picks up changes.
+        """
+        key = get_collection_key(item)
+        if key is None:
+            raise ValueError('{} can\'t be made available offline'.format(item))
+
+        if isinstance(item, Station):
+            tracks = item.load_tracks().get_tracks()
+        else:
+            tracks = item.tracks
+        tracks = [[track.id, track.filename] for track in tracks if track.id]
+
+        with self._lock:
+            old = self._collections.get(key)
+            self._collections[key] = {
+                'name': item.name,
+                'priority': int(priority),
+                'tracks': tracks
+            }
+            self._save()
+        if old is not None:
+            self._unpin_unwanted(old['tracks'])
+
+        self._enqueue_missing()
+        return len(tracks)
+
+    mark_async = asynchronous(mark)
+
+    def unmark(self, item):
+        """
+        Stop keeping *item* available offline, its tracks may be evicted from the cache again.
+        """
+        with self._lock:
+            collection = self._collections.pop(get_collection_key(item), None)
+            if collection is None:
+                return
+            self._save()
+        self._unpin_unwanted(collection['tracks'])
+
+    def set_priority(self, item, priority):
+        """
+        Change the download priority of the tracks of *item*.
+        """
+        with self._lock:
+            collection = self._collections.get(get_collection_key(item))
+            if collection is None:
+                return
+            collection['priority'] = int(priority)
+            self._save()
+            self._queue = []
+            self._queued.clear()
+        self._enqueue_missing()
+
+    def get_progress(self):
+        """
+        Return the number of downloaded and of all tracks that are available offline.
+        """
+        with self._lock:
+            wanted = self._get_wanted()
+        return sum(1 for filename in wanted if filename in settings_manager.file_cache), \
+            len(wanted)
+
+    def _get_wanted(self):
+        """
+        Return a dict of the filenames of all offline tracks to their track IDs and the
+        highest priority of their collections. The lock must be held.
+        """
+        wanted = {}
+        for collection in self._collections.values():
+            for track_id, filename in collection['tracks']:
+                priority = min(collection['priority'],
+                               wanted.get(filename, (None, collection['priority']))[1])
+                wanted[filename] = (track_id, priority)
+        return wanted
+
+    def _unpin_unwanted(self, tracks):
+        """
+        Unpin the files of *tracks* that belong to no other offline collection.
+        """
+        with self._lock:
+            wanted = self._get_wanted()
+        settings_manager.file_cache.pin_all(
+            [filename for _, filename in tracks if filename not in wanted], False)
+
+    def _enqueue_missing(self):
+        """
+        Pin the cached offline tracks and queue the missing ones for download.
+        """
+        file_cache = settings_manager.file_cache
+        with self._lock:
+            cached = []
+            for filename, (track_id, priority) in self._get_wanted().items():
+                if filename in file_cache:
+                    cached.append(filename)
+                elif filename not in self._queued:
+                    heapq.heappush(self._queue, (priority, next(self._counter), filename, track_id))
+                    self._queued.add(filename)
+            file_cache.pin_all(cached)
+
+            if not self._queue:
+                return
+            self._condition.notify_all()
+
+            workers = max(settings_manager.get('offline_downloads', 'clay_settings') or 0, 1)
+            while len(self._workers) < workers:
+                worker = Thread(target=self._work,
+                                name='clay-offline-{}'.format(len(self._workers)),
+                                daemon=True)
+                self._workers.append(worker)
+                worker.start()
+
+    def _work(self):
+        """
+        Worker thread body: download the queued tracks one by one.
+        """
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                _, _, filename, track_id = heapq.heappop(self._queue)
+                self._queued.discard(filename)
+                if filename not in self._get_wanted():
+                    continue
+
+            if not settings_manager.get_is_file_cached(filename):
+                self._download(filename, track_id)
+
+            with self._lock:
+                # Downloads pin the file when they add it, unless the player cached it first
+                # or the track was removed from the offline collections in the meantime
+                settings_manager.file_cache.pin(filename, filename in self._get_wanted())
+            self.progress_changed.fire(*self.get_progress())
+
+    def _download(self, filename, track_id):
+        """
+        Download a single track, the player takes precedence.
+        """
+        try:
+            url = gp.get_stream_url(track_id)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error('Failed to get the stream URL of %s: %s', filename, str(error))
+            return
+
+        download = start_download(filename, url, background=True, throttle=self._throttle,
+                                  pinned=True)
+        if not download.wait():
+            discard_download(filename)
+
+    def _throttle(self, size):
+        """
+        Called by the background downloads before reading *size* bytes.
+        Waits while the player waits for a download and keeps all background
+        downloads together below the configured bandwidth.
+        """
+        while is_foreground_active():
+            time.sleep(self.PAUSE_INTERVAL)
+
+        bandwidth = (settings_manager.get('offline_bandwidth_kbps', 'clay_settings') or 0) * 1024
+        if not bandwidth:
+            return
+
+        with self._throttle_lock:
+            now = time.monotonic()
+            start = max(self._next_chunk, now)
+            self._next_chunk = start + size / bandwidth
+        if start > now:
+            time.sleep(start - now)
+
+
+offline_manager = _OfflineManager()
@@ -1,9 +1,7 @@
 """
 On-screen display stuff.
 """
-from pydbus import SessionBus, Variant
 from clay.core import meta, logger, settings_manager
-from gi.repository import GLib
 
 NOTIFICATION_BUS_NAME = ".Notifications"
 BASE_NAME = "org.freedesktop"
@@ -13,23 +11,35 @@ ENABLED = settings_manager.get('desktop_notifications', 'clay_settings')
 class _OSDManager(object):
     """
     Manages OSD notifications via DBus.
+
+    Notifications are dropped until :meth:`start` connected to the bus.
     """
     def __init__(self):
+        self._last_id = 0
+        self.bus = None
+        self.notifications = None
+
         if not ENABLED:
             self._actions = {}
             return
 
-        self._last_id = 0
-        self.bus = SessionBus()
+        self._actions = {"default": lambda *args: None}
 
-        self.notifications = None
+    def start(self):
+        """
+        Connect to the session bus. Called once the UI is shown, pydbus takes long to import.
+        """
+        if not ENABLED or self.bus is not None:
+            return
+
+        from pydbus import SessionBus
+
+        self.bus = SessionBus()
         self.bus.watch_name(BASE_NAME + NOTIFICATION_BUS_NAME,
                             name_appeared=self._register_bus_name,
                             name_vanished=self._deregister_bus_name)
         self._register_bus_name(None)
 
-        self._actions = {"default": lambda *args: None}
-
     def add_to_action(self, action, action_name, function):
         """
         Register an action to the notification deamon
@@ -51,9 +61,11 @@ class _OSDManager(object):
            track (`clay.gp.Track`): The track that you want to send the notification for
            actions (`list`): A list with the actions that you want the notification to react to.
         """
-        if not ENABLED:
+        if self.notifications is None:
             return
 
+        from pydbus import Variant
+
         actions_ = []
         for action in actions:
             if action not in self._actions:
@@ -99,6 +111,8 @@ class _OSDManager(object):
         if self.notifications is None:
             return
 
+        from gi.repository import GLib
+
         try:
             self._last_id = self.notifications.Notify(meta.APP_NAME, self._last_id if replace else 0,
                                                       icon, summary, body,
@@ -118,6 +132,8 @@ class _OSDManager(object):
         Returns:
             Nothing.
         """
+        from gi.repository import GLib
+
         try:
             self.notifications = self.bus.get(NOTIFICATION_BUS_NAME)
             self.notifications.onActionInvoked = self._on_action
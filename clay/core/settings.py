@@ -7,7 +7,21 @@ import copy
 import errno
 import yaml
 import appdirs
-import pkg_resources
+
+from .cache import FileCache
+from .eventhook import EventHook
+
+# The C parser is much faster, PyYAML is not always built with it
+_SAFE_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_FULL_LOADER = getattr(yaml, 'CFullLoader', yaml.FullLoader)
+
+
+def _load_bundled_yaml(filename):
+    """
+    Parse a YAML file that is shipped next to this module.
+    """
+    with open(os.path.join(os.path.dirname(__file__), filename), 'r') as yaml_file:
+        return yaml.load(yaml_file, Loader=_SAFE_LOADER)
 
 
 class _SettingsEditor(dict):
@@ -44,7 +58,9 @@ class _Settings(object):
     def __init__(self):
         self._config = {}
         self._default_config = {}
-        self._cached_files = set()
+        self.file_cache = None
+        #: Fired with the filename when a file was added to the cache
+        self.file_cached = EventHook()
 
         self._config_dir = None
         self._config_file_path = None
@@ -85,25 +101,26 @@ class _Settings(object):
         Read config from file.
         """
         with open(self._config_file_path, 'r') as settings_file:
-            self._config = yaml.full_load(settings_file.read())
+            self._config = yaml.load(settings_file.read(), Loader=_FULL_LOADER)
 
-        # Load the configuration from Setuptools' ResourceManager API
-        self._default_config = yaml.safe_load(
-            pkg_resources.resource_string(__name__, "config.yaml"))
+        self._default_config = _load_bundled_yaml('config.yaml')
 
         # We only either the user colour or the default colours to ease parsing logic.
         if os.path.exists(self._colours_file_path):
             with open(self._colours_file_path, 'r') as colours_file:
-                self.colours_config = yaml.safe_load(colours_file.read())
+                self.colours_config = yaml.load(colours_file.read(), Loader=_SAFE_LOADER)
         else:
-            self.colours_config = yaml.safe_load(
-                pkg_resources.resource_string(__name__, "colours.yaml"))
+            self.colours_config = _load_bundled_yaml('colours.yaml')
 
     def _load_cache(self):
         """
-        Load cached files.
+        Load the index of cached files.
         """
-        self._cached_files = set(os.listdir(self._cache_dir))
+        self.file_cache = FileCache(
+            self._cache_dir,
+            (self.get('cache_size_mb', 'clay_settings') or 0) * 1024 * 1024,
+            self.get('cache_eviction_policy', 'clay_settings') or 'lru'
+        )
 
     def _commit_edits(self, config):
         """
@@ -124,8 +141,9 @@ class _Settings(object):
         """
         section = self.get_section(*sections)
 
+        # Fall back to the default for keys that are missing in the user configuration
         try:
-            return section.get(key)
+            return section[key]
         except (KeyError, TypeError):
             section = self.get_default_config_section(*sections)
             return section.get(key)
@@ -173,29 +191,39 @@ class _Settings(object):
         """
         return _SettingsEditor(self._config, self._commit_edits)
 
+    def get_cache_path(self, filename):
+        """
+        Get full path for *filename* inside the cache directory, whether it exists or not.
+        """
+        return os.path.join(self._cache_dir, filename)
+
     def get_cached_file_path(self, filename):
         """
-        Get full path to cached file.
+        Get full path to cached file, ``None`` if it isn't cached.
         """
-        path = os.path.join(self._cache_dir, filename)
-        if os.path.exists(path):
-            return path
-        return None
+        return self.file_cache.get_path(filename)
 
     def get_is_file_cached(self, filename):
         """
         Return ``True`` if *filename* is present in cache.
         """
-        return filename in self._cached_files
+        return filename in self.file_cache
+
+    def register_cached_file(self, filename, pinned=False):
+        """
+        Mark *filename* as present in cache after it was written
+        to :meth:`.FileCache.get_storage_path` by someone else.
+        Pass *pinned* to exclude it from eviction right away.
+        """
+        self.file_cache.add(filename, pinned=pinned)
+        self.file_cached.fire(filename)
 
     def save_file_to_cache(self, filename, content):
         """
         Save content into file in cache.
         """
-        path = os.path.join(self._cache_dir, filename)
-        with open(path, 'wb') as cachefile:
-            cachefile.write(content)
-        self._cached_files.add(filename)
+        path = self.file_cache.save(filename, content)
+        self.file_cached.fire(filename)
         return path
 
 
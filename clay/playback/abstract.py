@@ -4,17 +4,16 @@ An abstract class for playback
 Copyright (c) 2018, Valentijn van de Beek
 """
 import random
-import json
+from time import monotonic
 from copy import copy
+from threading import Lock
 from uuid import uuid1
 
-try:  # Python 3.x
-    from urllib.request import urlopen
-except ImportError:  # Python 2.x
-    from urllib2 import urlopen
-
-
-from clay.core import settings_manager, logger, EventHook, osd_manager, mpris2
+from clay.core import gp, settings_manager, logger, EventHook, osd_manager
+from clay.core.gp.utils import Priority
+from .proxy import stream_proxy
+from .publisher import StatePublisher
+from .state import INITIAL_STATE
 
 
 class _Queue(object):
@@ -56,8 +55,6 @@ class _Queue(object):
             track.queue_id = '/org/clay/queue/' + str(uuid1().hex[:6])
             self.tracks.append(track)
 
-        mpris2.mpris2_manager.TrackListReplaced.emit([track.queue_id for track in self.tracks],
-                                                     self.tracks[current_track_index].queue_id)
         self.current_track_index = current_track_index
 
     def goto_track(self, target):
@@ -82,14 +79,6 @@ class _Queue(object):
         # self.current_track_index = 0
         track = copy(track)
         track.queue_id = '/org/clay/queue/' + str(uuid1().hex[:6])
-
-        if self.tracks == []:
-            mpris2.mpris2_manager.TrackAdded.emit(mpris2.mpris2_manager.get_metadata(track),
-                                                  mpris2.mpris2_manager.notrack)
-        else:
-            mpris2.mpris2_manager.TrackAdded.emit(mpris2.mpris2_manager.get_metadata(track),
-                                                  self.tracks[-1].queue_id)
-
         self.tracks.append(track)
 
     def remove(self, track):
@@ -101,12 +90,42 @@ class _Queue(object):
 
         index = self.tracks.index(track)
         self.tracks.remove(track)
-        mpris2.mpris2_manager.TrackRemoved.emit(track.queue_id)
         if self.current_track_index is None:
             return
         if index < self.current_track_index:
             self.current_track_index -= 1
 
+    def peek_next(self):
+        """
+        Return the track :meth:`next` will advance to once the current one ends,
+        without advancing.
+        """
+        if self.current_track_index is None or not self.tracks:
+            return None
+        if self.repeat_one:
+            return self.get_current_track()
+
+        index = self.current_track_index + 1
+        if index >= len(self.tracks):
+            if not self.repeat_queue:
+                return None
+            index = 0
+        return self.tracks[index]
+
+    def get_upcoming(self, count):
+        """
+        Return up to *count* tracks that will be played after the current one,
+        in order, as long as the user doesn't change the queue.
+        """
+        if self.current_track_index is None or self.repeat_one:
+            return []
+
+        start = self.current_track_index + 1
+        if self.repeat_queue:
+            count = min(count, len(self.tracks) - 1)
+            return [self.tracks[index % len(self.tracks)] for index in range(start, start + count)]
+        return self.tracks[start:start + count]
+
     def get_current_track(self):
         """
         Return current :class:`clay.core.gp.Track`
@@ -176,10 +195,24 @@ class AbstractPlayer:
     queue_changed = EventHook()
     track_appended = EventHook()
     track_removed = EventHook()
+    seeked = EventHook()
+
+    #: Seconds before the end of a track at which the next one is handed to the backend
+    PRELOAD_SECONDS = 20
 
     def __init__(self):
         self._create_station_notification = None
+        self._url_future = None
+        self._refreshed_track = None
+        self._preload_track = None
+        self._preloaded = None
+        self._state = INITIAL_STATE
+        self._state_lock = Lock()
+        rate = settings_manager.get('position_updates_per_second', 'clay_settings')
+        self._position_interval = 1 / rate if rate else 0
+        self._last_position_update = 0
         self.queue = _Queue()
+        self._state_publisher = StatePublisher('/tmp/clay.json', self._get_state_data)
 
         # Add notification actions that we are going to use.
         osd_manager.add_to_action(
@@ -190,32 +223,81 @@ class AbstractPlayer:
             "media-playback-start", "Play", self.play_pause)
         osd_manager.add_to_action("media-skip-forward", "next", self.next)
 
+    def start(self):
+        """
+        Start the playback backend. Called once the UI is shown, before any track is played.
+        """
+        pass
+
     def broadcast_state(self):
         """
         Write current playback state into a ``/tmp/clay.json`` file.
+        Returns immediately, see :class:`.StatePublisher`.
+        """
+        self._state_publisher.request()
+
+    def _get_state_data(self):
+        """
+        Return the current playback state as written by :meth:`broadcast_state`.
         """
-        track = self.queue.get_current_track()
+        state = self._state
+        track = state.track
         if track is None:
-            data = dict(
+            return dict(
                 playing=False,
                 artist=None,
                 title=None,
                 progress=None,
                 length=None
             )
-        else:
-            data = dict(
-                loading=self.loading,
-                playing=self.playing,
-                artist=track.artist,
-                title=track.title,
-                progress=self.play_progress_seconds,
-                length=self.length_seconds,
-                album_name=track.album_name,
-                album_url=track.album_url
-            )
-        with open('/tmp/clay.json', 'w') as statefile:
-            statefile.write(json.dumps(data, indent=4))
+
+        return dict(
+            loading=state.loading,
+            playing=state.playing,
+            artist=track.artist,
+            title=track.title,
+            progress=state.progress_seconds,
+            length=state.length_seconds,
+            album_name=track.album_name,
+            album_url=track.album_url
+        )
+
+    @property
+    def state(self):
+        """
+        Return the current :class:`.PlayerState`, a consistent snapshot that is safe
+        to read from any thread.
+        """
+        return self._state
+
+    def _update_state(self, **changes):
+        """
+        Replace the state snapshot with a copy that has *changes* applied.
+        Called by the backend callbacks.
+        """
+        with self._state_lock:
+            self._state = self._state._replace(**changes)
+
+    def _position_changed(self):
+        """
+        Called by the backends whenever the playback position changes, which can be dozens
+        of times a second. Broadcasts the state and fires :attr:`media_position_changed` at
+        most ``position_updates_per_second`` times a second.
+        """
+        now = monotonic()
+        if now - self._last_position_update < self._position_interval:
+            return
+        self._last_position_update = now
+
+        self.broadcast_state()
+        self.media_position_changed.fire(self.play_progress)
+
+    def _start_track(self, track, **changes):
+        """
+        Reset the state for *track*, which the backend is about to play, and apply *changes*.
+        The duration is taken from the track until the backend knows better.
+        """
+        self._update_state(track=track, position=0, duration=track.duration / 1000, **changes)
 
     def load_queue(self, data, current_index=0):
         """
@@ -232,6 +314,7 @@ class AbstractPlayer:
         Clear the queue and stop playback
         """
         self.queue.clear()
+        self._update_state(track=None, loading=False, position=0, duration=0)
         self.queue_changed.fire()
         self.stop()
 
@@ -251,6 +334,7 @@ class AbstractPlayer:
         See :meth:`._Queue.append`
         """
         self.queue.append(track)
+        self._reset_preload()
         self.track_appended.fire(track)
 
     def remove_from_queue(self, track):
@@ -261,6 +345,7 @@ class AbstractPlayer:
         See :meth:`._Queue.remove`
         """
         self.queue.remove(track)
+        self._reset_preload()
         self.track_removed.fire(track)
 
     def create_station_from_track(self, track):
@@ -308,6 +393,7 @@ class AbstractPlayer:
         Enables or disabled single track repition
         """
         self.queue.repeat_one = value
+        self._reset_preload()
         self.playback_flags_changed.fire()
 
     @property
@@ -324,6 +410,7 @@ class AbstractPlayer:
         Enables or disabled single track repition
         """
         self.queue.repeat_queue = value
+        self._reset_preload()
         self.playback_flags_changed.fire()
 
     def get_queue_tracks(self):
@@ -339,27 +426,176 @@ class AbstractPlayer:
         """
         raise NotImplementedError
 
-    def _download_track(self, url, error, track):
+    def _request_url(self, track, callback, refresh=False):
+        """
+        Request the stream URL of *track*, cancelling the request for the previous
+        track if it didn't start yet.
+        """
+        if self._url_future is not None:
+            self._url_future.cancel()
+        self._url_future = self._get_url(track, callback, refresh=refresh)
+
+    @staticmethod
+    def _get_url(track, callback, **kwargs):
+        """
+        Request the URL the backend should open for *track*, see :meth:`.Track.get_url`.
+
+        If tracks are cached the URL points to the :class:`.StreamProxy`
+        which saves the stream into the cache while it is played.
+        """
+        def on_get_url(url, error, track):
+            """
+            Called when the stream URL is fetched.
+            """
+            if url is not None and settings_manager.get('download_tracks', 'play_settings'):
+                url = stream_proxy.get_url(track.filename, url)
+            callback(url, error, track)
+
+        return track.get_url(callback=on_get_url, **kwargs)
+
+    def _prefetch_urls(self):
+        """
+        Fetch the stream URLs of the next tracks in the background so skipping
+        to them doesn't have to wait for Google Play Music.
+        """
+        count = settings_manager.get('prefetch_urls', 'play_settings') or 0
+        for track in self.queue.get_upcoming(count):
+            if not settings_manager.get_is_file_cached(track.filename):
+                gp.get_stream_url_async(track.id, callback=None, priority=Priority.low)
+
+    def _stream_failed(self, track, callback):
+        """
+        Called when the stream of *track* couldn't be opened, e.g. because the server
+        refused an expired URL with 403. Fetches a new URL once and passes it to *callback*.
+
+        Returns ``True`` if a new URL was requested.
+        """
+        if not self._is_current(track) or self._refreshed_track is track:
+            return False
+
+        logger.debug('Stream of %s failed, requesting a new URL', track)
+        self._refreshed_track = track
+        gp.stream_urls.invalidate(track.id)
+        self._request_url(track, callback, refresh=True)
+        return True
+
+    def _is_current(self, track):
+        """
+        Return ``True`` if *track* is still the track the queue points to,
+        e.g. the user didn't skip it while its URL was being fetched.
+        """
+        return track is self.queue.get_current_track()
+
+    def _maybe_preload(self):
+        """
+        Request the URL of the next track once the current one is about to end,
+        see :attr:`PRELOAD_SECONDS`. Called on position changes.
+
+        The URL is requested this late because stream URLs expire.
+        """
+        state = self._state
+        if state.loading or self._preload_track is not None:
+            return
+
+        length = state.length_seconds
+        if not length or length - state.progress_seconds > self.PRELOAD_SECONDS:
+            return
+
+        track = self.queue.peek_next()
+        if track is None:
+            return
+
+        self._preload_track = track
+        path = settings_manager.get_cached_file_path(track.filename)
+        if path is not None:
+            self._preload_ready(path, None, track)
+        else:
+            self._get_url(track, self._preload_ready, priority=Priority.normal)
+
+    def _preload_ready(self, url, error, track):
+        """
+        Called once the URL of the next track is known, hands it to the backend
+        so it can switch tracks without a gap.
+        """
         if error:
-            logger.error(
-                "failed to request media URL for track %s: %s",
-                track.original_data,
-                str(error)
-            )
+            logger.error('Failed to preload track %s: %s', track, str(error))
+            return
+
+        if track is not self._preload_track or track is not self.queue.peek_next():
+            return
+
+        self._preloaded = track
+        self._append_preload(url)
+
+    def _reset_preload(self):
+        """
+        Forget the preloaded track, e.g. because the queue changed and another track
+        is up next. It is preloaded again on the next position change.
+        """
+        self._preload_track = None
+        if self._preloaded is not None:
+            self._preloaded = None
+            self._drop_preload()
+
+    def _preloaded_started(self):
+        """
+        Called by the backend once it switched to the preloaded track by itself.
+        Advances the queue without interrupting playback.
+        """
+        track = self._preloaded
+        self._preloaded = None
+        self._preload_track = None
+        if track is None:
             return
 
-        response = urlopen(url)
-        path = settings_manager.save_file_to_cache(
-            track.filename, response.read())
-        self._play_ready(path, None, track)
+        previous = self.queue.get_current_track()
+        if previous is not None:
+            previous.increment_playcount()
+
+        if self.queue.next() is not track:
+            # The queue changed behind our back, play what it says
+            self.play()
+            return
+
+        self._start_track(track)
+        self.broadcast_state()
+        self.track_changed.fire(track)
+        self._notify_track(track)
+
+    def _append_preload(self, url):
+        """
+        Queue *url* in the backend to be played after the current track.
+        """
+        raise NotImplementedError
+
+    def _drop_preload(self):
+        """
+        Remove the URL queued by :meth:`_append_preload` from the backend.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _notify_track(track):
+        """
+        Show a desktop notification for the track that started playing.
+        """
+        osd_manager.notify(track.title, "by {}\nfrom {}\n".format(track.artist, track.album_name),
+                           ("media-skip-backward", "media-playback-pause", "media-skip-forward"),
+                           track.get_artist_art_filename())
 
     @property
     def loading(self):
-        return self._loading
+        """
+        True while the URL of the current track is requested.
+        """
+        return self._state.loading
 
     @property
     def playing(self):
-        raise NotImplementedError
+        """
+        True if a song is being played at the moment.
+        """
+        return self._state.playing
 
     # Implement as a setter instead?
     def play_pause(self):
@@ -373,25 +609,25 @@ class AbstractPlayer:
         """
         Return current playback position in range ``[0;1]`` (``float``)
         """
-        raise NotImplementedError
+        return self._state.progress
 
     @property
     def play_progress_seconds(self):
         """
         Return the current playback position in seconds (``int``)
         """
-        raise NotImplementedError
+        return self._state.progress_seconds
 
     @property
     def time(self):
         """
         Returns:
            Get their current movie length in microseconds
-e        """
-        raise NotImplementedError
+        """
+        return self._state.time
 
     def _seeked(self):
-        mpris2.mpris2_manager.Seeked.emit(self.time)
+        self.seeked.fire(self.time)
 
     @time.setter
     def time(self, time):
@@ -435,14 +671,14 @@ e        """
         Returns:
           The current playback position in microseconds
         """
-        raise NotImplementedError
+        return self._state.length
 
     @property
     def length_seconds(self):
         """
         Return currently played track's length in seconds (``int``).
         """
-        raise NotImplementedError
+        return self._state.length_seconds
 
     def next(self, force=False):
         """
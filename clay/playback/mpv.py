@@ -3,9 +3,8 @@ An implementation of the Clay player using MPV
 
 Copyright (c) 2018, Clay Contributors
 """
-from clay.core import osd_manager, logger, settings_manager
+from clay.core import logger, settings_manager
 
-import mpv
 from .abstract import AbstractPlayer
 
 
@@ -18,21 +17,35 @@ class MPVPlayer(AbstractPlayer):
     """
 
     def __init__(self):
-        self.media_player = mpv.MPV()
+        self.media_player = None
+        self._stream_opened = False
+
+        AbstractPlayer.__init__(self)
+
+    def start(self):
+        """
+        Create the MPV instance, libmpv takes a while to load.
+        """
+        import mpv
+
+        # Open the next playlist entry before the current one ends, for gapless playback
+        self.media_player = mpv.MPV(prefetch_playlist=True, gapless_audio=True)
         self.media_player.observe_property('pause', self._media_state_changed)
         self.media_player.observe_property('stream-open-filename', self._media_state_changed)
-        self.media_player.observe_property('stream-pos', self._media_position_changed)
+        self.media_player.observe_property('time-pos', self._media_position_changed)
+        self.media_player.observe_property('duration', self._duration_changed)
         self.media_player.observe_property('idle-active', self._media_end_reached)
+        self.media_player.observe_property('playlist-pos', self._playlist_pos_changed)
 
-        AbstractPlayer.__init__(self)
-
-    def _media_state_changed(self, *_):
+    def _media_state_changed(self, name, value):
         """
         Called when a libVLC playback state changes.
         Broadcasts playback state & fires :attr:`media_state_changed` event.
         """
+        if name == 'pause':
+            self._update_state(playing=not value)
         self.broadcast_state()
-        self.media_state_changed.fire(self._loading, self.playing)
+        self.media_state_changed.fire(self.loading, self.playing)
 
     def _media_end_reached(self, event, value):
         """
@@ -40,18 +53,62 @@ class MPVPlayer(AbstractPlayer):
         Advances to the next track.
         """
         if value:
-            self.queue.get_current_track().increment_playcount()
+            track = self.queue.get_current_track()
+            if track is None:
+                return
+            # MPV goes idle without reading anything if the stream URL was refused
+            if not self._stream_opened and self._stream_failed(track, self._play_ready):
+                return
+            track.increment_playcount()
             self.next()
 
-    def _media_position_changed(self, *_):
+    def _media_position_changed(self, _, value):
         """
         Called when playback position changes (this happens few times each second.)
         Fires :attr:`.media_position_changed` event.
         """
-        self.broadcast_state()
-        self.media_position_changed.fire(
-            self.play_progress
-        )
+        if value is None:
+            # Nothing is playing
+            return
+        if not self._stream_opened:
+            self._stream_opened = True
+            self._refreshed_track = None
+        self._update_state(position=value)
+        self._maybe_preload()
+        self._position_changed()
+
+    def _duration_changed(self, _, value):
+        """
+        Called when MPV knows the length of the track.
+        """
+        if value:
+            self._update_state(duration=value)
+
+    def _playlist_pos_changed(self, _, value):
+        """
+        Called when MPV moves to another playlist entry. The playlist only holds
+        the current track and the preloaded one, so a position above zero means
+        MPV switched to the preloaded track. MPV reports ``-1`` while the playlist has
+        no current entry (at startup, when idle and at the end of the queue).
+        """
+        if value is None or value <= 0 or self._preloaded is None:
+            return
+
+        self._stream_opened = False
+        self.media_player.playlist_remove(0)
+        self._preloaded_started()
+
+    def _append_preload(self, url):
+        """
+        Append *url* to the MPV playlist, MPV starts opening it before the current track ends.
+        """
+        self.media_player.playlist_append(url)
+
+    def _drop_preload(self):
+        """
+        Remove everything but the current track from the MPV playlist.
+        """
+        self.media_player.playlist_clear()
 
     def _create_station_ready(self, station, error):
         """
@@ -81,52 +138,44 @@ class MPVPlayer(AbstractPlayer):
         track = self.queue.get_current_track()
         if track is None:
             return
-        self._loading = True
+        self._start_track(track, loading=True)
+        self._reset_preload()
         self.broadcast_state()
         self.track_changed.fire(track)
 
-        if settings_manager.get('download_tracks', 'play_settings') or \
-           settings_manager.get_is_file_cached(track.filename):
-            path = settings_manager.get_cached_file_path(track.filename)
-
-            if path is None:
-                logger.debug('Track %s not in cache, downloading...', track.id)
-                track.get_url(callback=self._download_track)
-            else:
-                logger.debug('Track %s in cache, playing', track.id)
-                self._play_ready(path, None, track)
+        path = settings_manager.get_cached_file_path(track.filename)
+        if path is not None:
+            logger.debug('Track %s in cache, playing', track.id)
+            self._play_ready(path, None, track)
         else:
             logger.debug('Starting to stream %s', track.id)
-            track.get_url(callback=self._play_ready)
+            self._request_url(track, self._play_ready)
+
+        self._prefetch_urls()
 
     def _play_ready(self, url, error, track):
         """
         Called once track's media stream URL request completes.
         If *error* is ``None``, tell libVLC to play media by *url*.
         """
-        self._loading = False
+        if not self._is_current(track):
+            return
+
+        self._update_state(loading=False)
         if error:
             # notification_area.notify('Failed to request media URL: {}'.format(str(error)))
             logger.error(
                 'Failed to request media URL for track %s: %s',
-                track.original_data,
+                track,
                 str(error)
             )
             return
         assert track
 
+        self._reset_preload()
+        self._stream_opened = False
         self.media_player.play(url)
-
-        osd_manager.notify(track.title, "by {}\nfrom {}\n".format(track.artist, track.album_name),
-                           ("media-skip-backward", "media-playback-pause", "media-skip-forward"),
-                           track.get_artist_art_filename())
-
-    @property
-    def playing(self):
-        """
-        True if a song is being played at the moment.
-        """
-        return not self.media_player.pause
+        self._notify_track(track)
 
     def play_pause(self):
         """
@@ -134,55 +183,7 @@ class MPVPlayer(AbstractPlayer):
         """
         self.media_player.pause = not self.media_player.pause
 
-    @property
-    def play_progress(self):
-        """
-        Return current playback position in range ``[0;1]`` (``float``).
-        """
-        try:
-            return self.media_player.playback_time / self.media_player.duration
-        except TypeError:
-            return 0
-
-    @property
-    def play_progress_seconds(self):
-        """
-        Return current playback position in seconds (``int``).
-        """
-        progress = self.media_player.playback_time
-        if progress is None:
-            return 0
-        return int(progress)
-
-    @property
-    def length(self):
-        """
-        Return currently played track's length in microseconds (``int``).
-        """
-        return self.length_seconds * 1e6
-
-    @property
-    def length_seconds(self):
-        """
-        Return currently played track's length in seconds (``int``).
-        """
-        duration = self.media_player.duration
-        if duration is None:
-            duration = 0
-        return int(duration)
-
-    @property
-    def time(self):
-        """
-        Returns:
-           Get their current movie length in microseconds
-        """
-        try:
-            return int(self.media_player.playback_time * 1e6)
-        except TypeError:
-            return 0
-
-    @time.setter
+    @AbstractPlayer.time.setter
     def time(self, time):
         """
         Sets the current time in microseconds.
@@ -196,6 +197,7 @@ class MPVPlayer(AbstractPlayer):
         except TypeError:
             pass
         else:
+            self._update_state(position=int(time / 1e6))
             self._seeked()
 
     def seek(self, delta):
@@ -0,0 +1,258 @@
+"""
+A local HTTP proxy that streams tracks to the player and saves them into the cache
+
+Copyright (c) 2018, Clay Contributors
+"""
+import os
+import re
+from http.client import HTTPException
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Thread, Lock
+from urllib.error import HTTPError
+from urllib.parse import quote, unquote
+from urllib.request import Request, urlopen
+
+from clay.core import settings_manager, logger
+from clay.core.download import get_download, start_download, discard_download
+
+#: Bytes copied at once between the cache file and the player
+CHUNK_SIZE = 64 * 1024
+#: Requests starting further than this beyond the downloaded part are not
+#: waited for but fetched from the server directly
+MAX_READ_AHEAD = 1024 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Parse a single range ``Range`` header into an inclusive ``(start, end)`` tuple.
+    Returns ``None`` if there is no header or it can't be satisfied.
+    """
+    match = _RANGE_RE.match(header or '')
+    if match is None or size is None:
+        return None
+
+    start, end = match.groups()
+    if start == '':
+        if end == '':
+            return None
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+
+    if start > end:
+        return None
+    return start, end
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves ``GET /<filename>`` from the cache, the running download or the server.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Handle a GET request from the player.
+        """
+        filename = unquote(self.path.lstrip('/'))
+        try:
+            path = settings_manager.get_cached_file_path(filename)
+            if path is not None:
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    # Deleted behind our back, download it again
+                    settings_manager.file_cache.remove(filename)
+                else:
+                    self._send_file(path, size)
+                    return
+
+            download = self.server.proxy.get_download(filename)
+            if download is None:
+                self.send_error(404)
+                return
+
+            download.attach_reader()
+            try:
+                if not download.wait_for_headers():
+                    self._send_upstream_error(download.error)
+                    return
+
+                byte_range = parse_range(self.headers.get('Range'), download.size)
+                if byte_range is not None and \
+                        byte_range[0] > download.downloaded + MAX_READ_AHEAD:
+                    self._pass_through(download.url)
+                    return
+
+                self._send_download(download, byte_range)
+            finally:
+                download.detach_reader()
+        except (BrokenPipeError, ConnectionResetError):
+            # The player closed the connection, e.g. because it seeked
+            pass
+
+    def _send_headers(self, size, byte_range):
+        """
+        Send the status line and headers for *byte_range* of a file of *size* bytes.
+        """
+        if byte_range is None:
+            self.send_response(200)
+            if size is not None:
+                self.send_header('Content-Length', str(size))
+        else:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, size))
+            self.send_header('Content-Length', str(end - start + 1))
+
+        self.send_header('Content-Type', 'audio/mpeg')
+        if size is not None:
+            self.send_header('Accept-Ranges', 'bytes')
+        if size is None and byte_range is None:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+
+    def _send_file(self, path, size):
+        """
+        Send a complete file from the cache.
+        """
+        byte_range = parse_range(self.headers.get('Range'), size)
+        start, end = byte_range or (0, size - 1)
+        self._send_headers(size, byte_range)
+
+        with open(path, 'rb') as cached_file:
+            cached_file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = cached_file.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                self.wfile.write(data)
+                remaining -= len(data)
+
+    def _send_download(self, download, byte_range):
+        """
+        Send a file that is still being downloaded, waiting for the missing parts.
+        """
+        start, end = byte_range or (0, None)
+        self._send_headers(download.size, byte_range)
+
+        with download.open() as part:
+            part.seek(start)
+            position = start
+            while end is None or position <= end:
+                available = download.wait_for(position)
+                if available <= position:
+                    # The download failed or ended
+                    break
+                if end is not None:
+                    available = min(available, end + 1)
+                data = part.read(min(CHUNK_SIZE, available - position))
+                self.wfile.write(data)
+                position += len(data)
+
+    def _pass_through(self, url):
+        """
+        Forward the request to the server without caching, e.g. for a seek far ahead.
+        """
+        request = Request(url, headers={'Range': self.headers['Range']})
+        try:
+            response = urlopen(request)
+        except (OSError, HTTPException) as error:
+            self._send_upstream_error(error)
+            return
+
+        with response:
+            self.send_response(response.status)
+            for header in ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges'):
+                if header in response.headers:
+                    self.send_header(header, response.headers[header])
+            self.end_headers()
+
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+
+    def _send_upstream_error(self, error):
+        """
+        Pass an error of the server on to the player, e.g. a 403 for an expired URL.
+        """
+        self.send_error(error.code if isinstance(error, HTTPError) else 502)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug('Proxy: ' + format, *args)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server that handles every request in its own thread.
+    """
+    daemon_threads = True
+
+
+class StreamProxy(object):
+    """
+    Local HTTP proxy the players stream through.
+
+    The first request for a track starts a download into the cache, all requests
+    for the track are served from that download as it progresses, so playback starts
+    on the first bytes and seeks into the downloaded part don't touch the network.
+    Complete tracks are served from the cache.
+
+    Singleton.
+    """
+    def __init__(self):
+        self._server = None
+        self._urls = {}
+        self._lock = Lock()
+
+    def _ensure_server(self):
+        """
+        Start the server on a free local port if it isn't running yet.
+        """
+        if self._server is not None:
+            return
+
+        self._server = _Server(('127.0.0.1', 0), _RequestHandler)
+        self._server.proxy = self
+        Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def get_url(self, filename, url):
+        """
+        Return a local URL that streams *filename* from the server *url* and saves it into
+        the cache. *url* replaces the previous server URL of *filename*, e.g. once it expired.
+        """
+        with self._lock:
+            self._ensure_server()
+            self._urls[filename] = url
+        discard_download(filename)
+
+        return 'http://127.0.0.1:{}/{}'.format(self._server.server_address[1], quote(filename))
+
+    def get_download(self, filename):
+        """
+        Return the :class:`.Download` of *filename*, starts it if necessary.
+        Returns ``None`` if no server URL is known for *filename*.
+        """
+        download = get_download(filename)
+        if download is not None and download.error is not None:
+            # Reported to the player until it asks for a new URL
+            return download
+
+        with self._lock:
+            url = self._urls.get(filename)
+        if url is None:
+            if download is None:
+                return None
+            # Started by the offline sync
+            url = download.url
+        return start_download(filename, url)
+
+
+stream_proxy = StreamProxy()
@@ -0,0 +1,106 @@
+"""
+Publishes the playback state into a JSON file for status bars and scripts
+
+Copyright (c) 2018, Clay Contributors
+"""
+import json
+import os
+import tempfile
+import time
+from threading import Thread, Condition
+
+from clay.core import logger
+
+
+class StatePublisher(object):
+    """
+    Writes the state returned by *collect* into the JSON file at *path*.
+
+    :meth:`request` only marks the state as dirty and returns, a background thread
+    collects and writes it. The file is only written if the state changed, changes of
+    nothing but the ``progress`` field are written at most every :attr:`PROGRESS_INTERVAL`
+    seconds. The file is replaced atomically, readers never see a partial write.
+    """
+    #: Minimum seconds between two writes that only advance the progress
+    PROGRESS_INTERVAL = 1
+
+    def __init__(self, path, collect):
+        self._path = path
+        self._collect = collect
+        self._dirty = False
+        self._written = None
+        self._last_write = 0
+        self._thread = None
+        self._condition = Condition()
+
+    def request(self):
+        """
+        Publish the current state soon, never blocks.
+        """
+        with self._condition:
+            self._dirty = True
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='clay-state-publisher', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        """
+        Thread body.
+        """
+        while True:
+            with self._condition:
+                while not self._dirty:
+                    self._condition.wait()
+                self._dirty = False
+
+            try:
+                data = self._collect()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error('Failed to collect the playback state: %s', str(error))
+                continue
+
+            if data == self._written:
+                continue
+
+            if self._is_progress_only(data):
+                delay = self._last_write + self.PROGRESS_INTERVAL - time.monotonic()
+                if delay > 0:
+                    # Any other change wakes us up earlier
+                    with self._condition:
+                        self._condition.wait(delay)
+                        self._dirty = True
+                    continue
+
+            self._write(data)
+
+    def _is_progress_only(self, data):
+        """
+        Return ``True`` if *data* differs from the written state in the progress only.
+        """
+        if self._written is None or data.keys() != self._written.keys():
+            return False
+        return all(value == self._written[key] for key, value in data.items()
+                   if key != 'progress')
+
+    def _write(self, data):
+        """
+        Replace the file with *data*.
+        """
+        directory, filename = os.path.split(self._path)
+        try:
+            handle, temp_path = tempfile.mkstemp(prefix='.' + filename, dir=directory)
+            try:
+                with os.fdopen(handle, 'w') as statefile:
+                    statefile.write(json.dumps(data, indent=4))
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, self._path)
+            except OSError:
+                os.remove(temp_path)
+                raise
+        except OSError as error:
+            logger.error('Failed to write the playback state to %s: %s', self._path, str(error))
+            return
+
+        self._written = data
+        self._last_write = time.monotonic()
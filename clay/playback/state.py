@@ -0,0 +1,59 @@
+"""
+Snapshot of the player state
+
+Copyright (c) 2018, Clay Contributors
+"""
+from collections import namedtuple
+
+
+class PlayerState(namedtuple('PlayerState', ['track', 'loading', 'playing', 'position',
+                                             'duration'])):
+    """
+    Immutable snapshot of the player state.
+
+    The backend callbacks replace the snapshot whenever the state changes, readers get
+    a consistent state without calling into libVLC or libmpv. *position* and *duration*
+    are in seconds (``float``).
+    """
+    __slots__ = ()
+
+    @property
+    def progress(self):
+        """
+        Return the playback position in range ``[0;1]`` (``float``).
+        """
+        if not self.duration:
+            return 0
+        return min(self.position / self.duration, 1)
+
+    @property
+    def progress_seconds(self):
+        """
+        Return the playback position in seconds (``int``).
+        """
+        return int(self.position)
+
+    @property
+    def length_seconds(self):
+        """
+        Return the length of the track in seconds (``int``).
+        """
+        return int(self.duration)
+
+    @property
+    def time(self):
+        """
+        Return the playback position in microseconds (``int``).
+        """
+        return int(self.position * 1e6)
+
+    @property
+    def length(self):
+        """
+        Return the length of the track in microseconds (``int``).
+        """
+        return int(self.duration * 1e6)
+
+
+#: The state before anything was played
+INITIAL_STATE = PlayerState(track=None, loading=False, playing=False, position=0, duration=0)
@@ -27,6 +27,18 @@ class VLCPlayer(AbstractPlayer):
     """
 
     def __init__(self):
+        self.instance = None
+        self.media_player = None
+        self.media_list_player = None
+        self.media_list = None
+        self._list_advanced = False
+        self.equalizer = None
+        AbstractPlayer.__init__(self)
+
+    def start(self):
+        """
+        Create the libVLC instance, loading its plugins takes a while.
+        """
         self.instance = vlc.Instance()
         print_func = CFUNCTYPE(c_void_p,
                                c_void_p,  # data
@@ -43,10 +55,13 @@ class VLCPlayer(AbstractPlayer):
         )
 
         self.media_player = self.instance.media_player_new()
+        # The list player moves on to the preloaded media by itself, without a gap
+        self.media_list_player = self.instance.media_list_player_new()
+        self.media_list_player.set_media_player(self.media_player)
 
         self.media_player.event_manager().event_attach(
             vlc.EventType.MediaPlayerPlaying,
-            self._media_state_changed
+            self._media_playing
         )
         self.media_player.event_manager().event_attach(
             vlc.EventType.MediaPlayerStopped,
@@ -54,7 +69,7 @@ class VLCPlayer(AbstractPlayer):
         )
         self.media_player.event_manager().event_attach(
             vlc.EventType.MediaPlayerPaused,
-            self._media_state_changed
+            self._media_paused
         )
         self.media_player.event_manager().event_attach(
             vlc.EventType.MediaPlayerEndReached,
@@ -64,21 +79,50 @@ class VLCPlayer(AbstractPlayer):
             vlc.EventType.MediaPlayerPositionChanged,
             self._media_position_changed
         )
+        self.media_player.event_manager().event_attach(
+            vlc.EventType.MediaPlayerTimeChanged,
+            self._media_time_changed
+        )
+        self.media_player.event_manager().event_attach(
+            vlc.EventType.MediaPlayerLengthChanged,
+            self._media_length_changed
+        )
+        self.media_player.event_manager().event_attach(
+            vlc.EventType.MediaPlayerEncounteredError,
+            self._media_error
+        )
+        self.media_list_player.event_manager().event_attach(
+            vlc.EventType.MediaListPlayerNextItemSet,
+            self._next_item_set
+        )
 
         self.equalizer = vlc.libvlc_audio_equalizer_new()
         self.media_player.set_equalizer(self.equalizer)
-        self._create_station_notification = None
-        AbstractPlayer.__init__(self)
 
     def _media_state_stopped(self, _):
         """
         Called when a libVLC playback state changes.
         Fires the :attr:`media_state_changed` event.
         """
+        self._update_state(playing=False)
         self.broadcast_state()
         self.media_state_stopped.fire()
 #        self.media_state_changed.fire(self.loading, self.playing)
 
+    def _media_playing(self, event):
+        """
+        Called when libVLC starts or resumes playback.
+        """
+        self._update_state(playing=True)
+        self._media_state_changed(event)
+
+    def _media_paused(self, event):
+        """
+        Called when libVLC pauses playback.
+        """
+        self._update_state(playing=False)
+        self._media_state_changed(event)
+
     def _media_state_changed(self, event):
         """
         Called when a libVLC playback state changes.
@@ -94,19 +138,76 @@ class VLCPlayer(AbstractPlayer):
         Increments the playcount and advances to the next track.
         """
         assert event
+        if self._preloaded is not None or self._list_advanced:
+            # The list player continues or already continued with the preloaded track
+            self._list_advanced = False
+            return
         self.queue.get_current_track().increment_playcount()
         self.next()
 
+    def _media_error(self, event):
+        """
+        Called when libVLC fails to play the media, e.g. because its URL expired.
+        Retries the current track with a new URL.
+        """
+        assert event
+        track = self.queue.get_current_track()
+        if track is not None and not self._stream_failed(track, self._play_ready):
+            logger.error('Failed to play track %s', track)
+
     def _media_position_changed(self, event):
         """
         Called when playback position changes (this happens few times each second.)
         Fires :attr:`.media_position_changed` event.
         """
         assert event
-        self.broadcast_state()
-        self.media_position_changed.fire(
-            self.play_progress
-        )
+        self._refreshed_track = None
+        self._list_advanced = False
+        self._maybe_preload()
+        self._position_changed()
+
+    def _media_time_changed(self, event):
+        """
+        Called with the playback position in milliseconds.
+        """
+        self._update_state(position=event.u.new_time / 1000)
+
+    def _media_length_changed(self, event):
+        """
+        Called once libVLC knows the length of the track in milliseconds.
+        """
+        if event.u.new_length > 0:
+            self._update_state(duration=event.u.new_length / 1000)
+
+    def _next_item_set(self, event):
+        """
+        Called when the list player starts a media, either because a track was played
+        or because it moved on to the preloaded track.
+        """
+        assert event
+        if self._preloaded is not None:
+            self._list_advanced = True
+            self._preloaded_started()
+
+    def _append_preload(self, url):
+        """
+        Append *url* to the media list, the list player plays it after the current track.
+        """
+        self.media_list.lock()
+        try:
+            self.media_list.add_media(url)
+        finally:
+            self.media_list.unlock()
+
+    def _drop_preload(self):
+        """
+        Remove the preloaded media, it is always the last one in the media list.
+        """
+        self.media_list.lock()
+        try:
+            self.media_list.remove_index(self.media_list.count() - 1)
+        finally:
+            self.media_list.unlock()
 
     def _create_station_ready(self, station, error):
         """
@@ -136,58 +237,51 @@ class VLCPlayer(AbstractPlayer):
         track = self.queue.get_current_track()
         if track is None:
             return
-        self._loading = True
+        self._start_track(track, loading=True)
+        self._reset_preload()
         self.broadcast_state()
         self.track_changed.fire(track)
 
-        if settings_manager.get('download_tracks', 'play_settings') or \
-           settings_manager.get_is_file_cached(track.filename):
-            path = settings_manager.get_cached_file_path(track.filename)
-
-            if path is None:
-                logger.debug('Track %s not in cache, downloading...', track.id)
-                track.get_url(callback=self._download_track)
-            else:
-                logger.debug('Track %s in cache, playing', track.id)
-                self._play_ready(path, None, track)
+        path = settings_manager.get_cached_file_path(track.filename)
+        if path is not None:
+            logger.debug('Track %s in cache, playing', track.id)
+            self._play_ready(path, None, track)
         else:
             logger.debug('Starting to stream %s', track.id)
-            track.get_url(callback=self._play_ready)
+            self._request_url(track, self._play_ready)
+
+        self._prefetch_urls()
 
     def _play_ready(self, url, error, track):
         """
         Called once track's media stream URL request completes.
         If *error* is ``None``, tell libVLC to play media by *url*.
         """
-        self._loading = False
+        if not self._is_current(track):
+            return
+
+        self._update_state(loading=False)
 
         if error:
             # notification_area.notify('Failed to request media URL: {}'.format(str(error)))
             logger.error(
                 'Failed to request media URL (%s) for track %s: %s',
-                url, track.original_data, str(error)
+                url, track, str(error)
             )
             return
         assert track
-        media = vlc.Media(url)
-        self.media_player.set_media(media)
-        self.media_player.play()
-        osd_manager.notify(track.title, "by {}\nfrom {}\n".format(track.artist, track.album_name),
-                           ("media-skip-backward", "media-playback-pause", "media-skip-forward"),
-                           track.get_artist_art_filename())
-
-    @property
-    def playing(self):
-        """
-        True if current libVLC state is :attr:`vlc.State.Playing`
-        """
-        return self.media_player.get_state() == vlc.State.Playing
+        self._reset_preload()
+        self.media_list = self.instance.media_list_new([url])
+        self.media_list_player.set_media_list(self.media_list)
+        self.media_list_player.play_item_at_index(0)
+        self._notify_track(track)
 
     def stop(self):
         """
         Stop playing the current song outright.
         """
-        self.media_player.stop()
+        self._reset_preload()
+        self.media_list_player.stop()
 
     def play_pause(self):
         """
@@ -209,32 +303,7 @@ class VLCPlayer(AbstractPlayer):
                                                  "media-skip-forward"), "media-playback-start")
             self.media_player.play()
 
-    @property
-    def play_progress(self):
-        """
-        Returns:
-            A float of the current playback position in range of 0 to 1.
-        """
-        return self.media_player.get_position()
-
-    @property
-    def play_progress_seconds(self):
-        """
-        Returns:
-            The current playback position in seconds.
-
-        """
-        return int(self.play_progress * self.media_player.get_length() / 1000)
-
-    @property
-    def time(self):
-        """
-        Returns:
-           Get their current movie length in microseconds
-        """
-        return self.media_player.get_time()
-
-    @time.setter
+    @AbstractPlayer.time.setter
     def time(self, time):
         """
         Sets the current time in microseconds.
@@ -243,7 +312,8 @@ class VLCPlayer(AbstractPlayer):
         Args:
            time: Time in microseconds.
         """
-        self.media_player.set_time(time)
+        self.media_player.set_time(int(time / 1000))
+        self._update_state(position=time / 1e6)
         self._seeked()
 
     @property
@@ -271,28 +341,14 @@ class VLCPlayer(AbstractPlayer):
         """
         self.media_player.set_mute(not self.media_player.audio_get_mute())
 
-    @property
-    def length(self):
-        """
-        Returns:
-            The current playback position in microseconds
-        """
-        return self.media_player.get_length()
-
-    @property
-    def length_seconds(self):
-        """
-        Returns:
-           The current playback in position in seconds
-        """
-        return self.length // 1000
-
     def seek(self, delta):
         """
         Seek to relative position.
         *delta* must be a ``float`` in range ``[-1;1]``.
         """
-        self.media_player.set_position(self.play_progress + delta)
+        position = self.play_progress + delta
+        self.media_player.set_position(position)
+        self._update_state(position=position * self.state.duration)
         self._seeked()
 
     def seek_absolute(self, position):
@@ -301,6 +357,7 @@ class VLCPlayer(AbstractPlayer):
         *position* must be a ``float`` in range ``[0;1]``.
         """
         self.media_player.set_position(position)
+        self._update_state(position=position * self.state.duration)
         self._seeked()
 
     @staticmethod
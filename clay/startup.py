@@ -0,0 +1,46 @@
+"""
+Startup profiling, see ``clay --profile-startup``.
+"""
+from threading import Lock
+from time import perf_counter
+
+
+class _StartupProfile(object):
+    """
+    Records how long the startup phases take.
+
+    A phase ends with :meth:`mark` and begins where the previous one ended, the first one
+    when this module was imported (which :mod:`clay.app` does before anything else).
+
+    Singleton.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._started = perf_counter()
+        self._last_mark = self._started
+        self._phases = []
+        self._lock = Lock()
+
+    def mark(self, phase):
+        """
+        Record that *phase* ended now.
+        """
+        with self._lock:
+            now = perf_counter()
+            self._phases.append((phase, now - self._last_mark, now - self._started))
+            self._last_mark = now
+
+    def format(self):
+        """
+        Return the recorded phases as a table with durations and totals in milliseconds.
+        """
+        width = max([len(phase) for phase, _, _ in self._phases] + [len('Phase')])
+        lines = ['{:<{width}} {:>8} {:>8}'.format('Phase', 'ms', 'total', width=width)]
+        for phase, duration, total in self._phases:
+            lines.append('{:<{width}} {:>8.1f} {:>8.1f}'.format(
+                phase, duration * 1000, total * 1000, width=width
+            ))
+        return '\n'.join(lines)
+
+
+startup_profile = _StartupProfile()
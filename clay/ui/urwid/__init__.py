@@ -1,10 +1,13 @@
-import urwid
 import sys
 
-from clay.core import gp, settings_manager, logger
+import urwid
+
+from clay.core import gp, settings_manager, logger, offline_manager, osd_manager
 from clay.playback.player import get_player
+from clay.startup import startup_profile
 
 from .clipboard import copy  # noqa: F401
+from .dispatcher import dispatcher, on_main_loop
 from .hotkeys import hotkey_manager
 from .notifications import notification_area
 from .playbar import PlayBar
@@ -19,14 +22,29 @@ class AppWidget(urwid.Frame):
     Root widget.
 
     Handles tab switches, global keypresses etc.
+
+    Pages are constructed when they are shown for the first time.
     """
+    #: Page classes in tab order
+    PAGE_CLASSES = (
+        DebugPage,      # noqa: F405
+        LibraryPage,    # noqa: F405
+        ArtistsPage,    # noqa: F405
+        AlbumsPage,     # noqa: F405
+        StationsPage,   # noqa: F405
+        PlaylistsPage,  # noqa: F405
+        SearchPage,     # noqa: F405
+        QueuePage,      # noqa: F405
+        SettingsPage    # noqa: F405
+    )
+
     class Tab(urwid.Text):
         """
         Represents a single tab in header tabbar.
         """
 
-        def __init__(self, page):
-            self.page = page
+        def __init__(self, page_class):
+            self.page = page_class
             super(AppWidget.Tab, self).__init__(
                 self.get_title()
             )
@@ -53,23 +71,15 @@ class AppWidget(urwid.Frame):
             )
 
     def __init__(self):
-        self.pages = [
-            DebugPage(self),      # noqa: F405
-            LibraryPage(self),    # noqa: F405
-            ArtistsPage(self),    # noqa: F405
-            AlbumsPage(self),     # noqa: F405
-            StationsPage(self),   # noqa: F405
-            PlaylistsPage(self),  # noqa: F405
-            SearchPage(self),     # noqa: F405
-            QueuePage(self),      # noqa: F405
-            SettingsPage(self)    # noqa: F405
-        ]
-        self.tabs = [AppWidget.Tab(page) for page in self.pages]
+        self.pages = {}
+        self.tabs = [AppWidget.Tab(page_class) for page_class in self.PAGE_CLASSES]
         self.current_page = None
         self.loop = None
 
         notification_area.set_app(self)
         self._login_notification = None
+        self._offline_notification = None
+        offline_manager.progress_changed += self.offline_progress_changed
 
         self._cancel_actions = []
 
@@ -89,7 +99,28 @@ class AppWidget(urwid.Frame):
         )
 
         self.set_page('library')
+
+    def start_services(self, *_):
+        """
+        Log in and start everything that isn't needed to draw the UI.
+        Called once the first frame is shown.
+        """
         self.log_in()
+        startup_profile.mark('login started')
+
+        player.start()
+        startup_profile.mark('player backend')
+
+        osd_manager.start()
+        startup_profile.mark('notifications')
+
+        # Imports pydbus
+        from clay.core import mpris2
+        mpris2.start()
+        startup_profile.mark('mpris2')
+
+        if startup_profile.enabled:
+            raise urwid.ExitMainLoop()
 
     def log_in(self, use_token=True):
         """
@@ -127,6 +158,7 @@ class AppWidget(urwid.Frame):
                 'Please set your credentials on the settings page.'
             )
 
+    @on_main_loop
     def on_check_authtoken(self, success, error):
         """
         Called once cached auth token is validated.
@@ -146,6 +178,7 @@ class AppWidget(urwid.Frame):
         else:
             self._login_notification.close()
 
+    @on_main_loop
     def on_login(self, success, error):
         """
         Called once user authorization finishes.
@@ -167,11 +200,31 @@ class AppWidget(urwid.Frame):
 
         self._login_notification.close()
 
+    @on_main_loop
+    def offline_progress_changed(self, downloaded, total):
+        """
+        Called whenever the offline sync finished a track.
+        Shows the progress unless the notification was closed, shows the end in any case.
+        """
+        if downloaded == total:
+            message = 'Offline sync: all {} tracks are available offline'.format(total)
+        else:
+            message = 'Offline sync: {} of {} tracks downloaded'.format(downloaded, total)
+
+        notification = self._offline_notification
+        if notification is None:
+            self._offline_notification = notification_area.notify(message)
+        elif notification.is_alive or downloaded == total:
+            notification.update(message)
+        if downloaded == total:
+            self._offline_notification = None
+
     def set_loop(self, loop):
         """
         Assign a MainLoop to this app.
         """
         self.loop = loop
+        dispatcher.set_loop(loop)
 
     def set_page(self, slug):
         """
@@ -182,26 +235,40 @@ class AppWidget(urwid.Frame):
         except AttributeError as e:
             logger.error(str(e))
 
-        page = [page for page in self.pages if page.slug == slug][0]
+        page = self.get_page(slug)
         self.current_page = page
+        if page.dirty:
+            page.dirty = False
+            page.refresh()
         self.contents['body'] = (page, None)
 
         for tab in self.tabs:
-            tab.set_active(False)
-            if tab.page == page:
-                tab.set_active(True)
+            tab.set_active(tab.page.slug == slug)
 
         self.redraw()
 
         page.activate()
 
+    def get_page(self, slug):
+        """
+        Return the page with *slug*, it is constructed if it wasn't shown yet.
+        """
+        page = self.pages.get(slug)
+        if page is None:
+            page_class = next(page_class for page_class in self.PAGE_CLASSES
+                              if page_class.slug == slug)
+            page = self.pages[slug] = page_class(self)
+        return page
+
     def redraw(self):
         """
         Redraw screen.
         Needs to be called by other widgets if UI was changed from a different thread.
+
+        Safe to call from any thread: the screen is drawn by the main loop, once for
+        all the requests made since the last frame (see :data:`.dispatcher`).
         """
-        if self.loop:
-            self.loop.draw_screen()
+        dispatcher.redraw()
 
     def append_cancel_action(self, action):
         """
@@ -351,8 +418,19 @@ def main():
 
     # Run the actual program
     app_widget = AppWidget()
+    startup_profile.mark('app widget')
     loop = urwid.MainLoop(app_widget, palette,
                           event_loop=urwid.GLibEventLoop())
     app_widget.set_loop(loop)
     loop.screen.set_terminal_properties(256)
-    loop.run()
+    startup_profile.mark('main loop')
+
+    # Like loop.run(), but the first frame is drawn before anything slow is started
+    try:
+        with loop.start():
+            loop.draw_screen()
+            startup_profile.mark('first frame')
+            loop.set_alarm_in(0, app_widget.start_services)
+            loop.event_loop.run()
+    except urwid.ExitMainLoop:
+        pass
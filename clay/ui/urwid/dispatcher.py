@@ -0,0 +1,138 @@
+"""
+Runs UI updates on the main loop.
+"""
+import os
+from functools import wraps
+from threading import Lock, current_thread, main_thread
+from time import monotonic
+
+from clay.core import logger
+
+
+class _Dispatcher(object):
+    """
+    Marshals UI mutations from worker threads onto the urwid main loop.
+
+    Calls are queued and the main loop is woken up once through a pipe, no matter
+    how many calls arrive in the meantime. It runs all queued calls and then draws
+    a single frame. Frames are drawn at most :attr:`MAX_FPS` times per second,
+    later redraw requests are merged into the next frame.
+
+    Singleton.
+    """
+    #: Maximum number of frames drawn per second
+    MAX_FPS = 20
+
+    def __init__(self):
+        self._loop = None
+        self._pipe = None
+        self._calls = []
+        self._wake_pending = False
+        self._redraw_pending = False
+        self._frame_alarm = None
+        self._last_frame = 0
+        self._lock = Lock()
+
+    def set_loop(self, loop):
+        """
+        Attach to the urwid *loop*. Calls queued before are run once it is running.
+        """
+        self._loop = loop
+        self._pipe = loop.watch_pipe(self._on_wake)
+        with self._lock:
+            if self._calls or self._redraw_pending:
+                self._wake_pending = True
+                os.write(self._pipe, b'.')
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call *func* with the given arguments on the main loop and redraw the screen afterwards.
+        Safe to call from any thread, never blocks.
+        """
+        self._request((func, args, kwargs))
+
+    def redraw(self):
+        """
+        Request a redraw of the screen. Safe to call from any thread.
+        """
+        self._request(None)
+
+    def _request(self, call):
+        """
+        Queue *call* (or only a redraw if it is ``None``) and wake up the main loop.
+        """
+        with self._lock:
+            if call is not None:
+                self._calls.append(call)
+            self._redraw_pending = True
+            if self._wake_pending or self._pipe is None:
+                return
+            self._wake_pending = True
+        os.write(self._pipe, b'.')
+
+    def _on_wake(self, _):
+        """
+        Called by the main loop when the pipe was written to.
+        Runs all queued calls and schedules a frame.
+        """
+        with self._lock:
+            calls, self._calls = self._calls, []
+            self._wake_pending = False
+
+        for func, args, kwargs in calls:
+            try:
+                func(*args, **kwargs)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error('Failed to update the UI in %s: %s', func, str(error))
+
+        self._schedule_frame()
+        return True
+
+    def _schedule_frame(self):
+        """
+        Draw the screen now or, if the last frame was drawn too recently, set an alarm for it.
+        """
+        if self._frame_alarm is not None:
+            return
+
+        delay = self._last_frame + 1 / self.MAX_FPS - monotonic()
+        if delay > 0:
+            self._frame_alarm = self._loop.set_alarm_in(delay, self._frame)
+        else:
+            self._frame()
+
+    def _frame(self, *_):
+        """
+        Draw a single frame if a redraw was requested.
+        """
+        self._frame_alarm = None
+        with self._lock:
+            if not self._redraw_pending:
+                return
+            self._redraw_pending = False
+        self._last_frame = monotonic()
+        self._loop.draw_screen()
+
+
+dispatcher = _Dispatcher()
+
+
+def on_main_loop(func):
+    """
+    Decorates a UI callback to always run on the main loop.
+
+    Called on the main thread, the original function runs right away. Called from any
+    other thread (e. g. an :func:`asynchronous` callback or a player event), it is queued
+    with :data:`dispatcher` and the wrapper returns ``None``.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        """
+        Inner function.
+        """
+        if current_thread() is main_thread():
+            return func(*args, **kwargs)
+        dispatcher.call(func, *args, **kwargs)
+        return None
+
+    return wrapper
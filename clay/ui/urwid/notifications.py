@@ -3,6 +3,8 @@ Notification widgets.
 """
 import urwid
 
+from .dispatcher import on_main_loop
+
 
 class _Notification(urwid.Columns):
     """
@@ -43,6 +45,7 @@ class _Notification(urwid.Columns):
         ] + ['    {}'.format(line) for line in message[1:]])
         self.text.set_text(_Notification.TEMPLATE.format(message))
 
+    @on_main_loop
     def update(self, message):
         """
         Update notification message.
@@ -62,6 +65,7 @@ class _Notification(urwid.Columns):
                 return True
         return False
 
+    @on_main_loop
     def close(self):
         """
         Close notification.
@@ -103,6 +107,7 @@ class _NotificationArea(urwid.Pile):
         self.append_notification(notification)
         return notification
 
+    @on_main_loop
     def append_notification(self, notification):
         """
         Append an existing notification (that was probably closed).
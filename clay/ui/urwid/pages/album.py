@@ -5,7 +5,7 @@ import urwid
 
 from .page import AbstractPage, AbstractListBox, AbstractListItem
 from clay.core import gp
-from clay.ui.urwid import SongListBox
+from clay.ui.urwid import SongListBox, on_main_loop
 
 
 class AlbumListBox(AbstractListBox):
@@ -18,13 +18,15 @@ class AlbumListBox(AbstractListBox):
 
     def populate(self, albums):
         items = []
-        for album in sorted(albums, key=albums.__getitem__):
-            album = AbstractListItem(albums[album], self._icon)
+        # The albums are already ordered by name
+        for album in albums.values():
+            album = AbstractListItem(album, self._icon)
             urwid.connect_signal(album, 'activate', self.item_activated)
             items.append(album)
         self.walker[:] = items
         self.app.redraw()
 
+    @on_main_loop
     def auth_state_changed(self, is_auth):
         """
         Called when auth state changes (e. g. user is logged in).
@@ -46,20 +48,9 @@ class AlbumsPage(urwid.Columns, AbstractPage):
     - List of playlists (:class:`.PlaylistListBox`)
     - List of songs in selected playlist (:class:`clay:songlist:SongListBox`)
     """
-    @property
-    def name(self):
-        return 'Albums'
-
-    @property
-    def key(self):
-        return 3
-
-    @property
-    def slug(self):
-        """
-        Return page ID (str).
-        """
-        return "albums"
+    name = 'Albums'
+    key = 3
+    slug = 'albums'
 
     def __init__(self, app):
         self.app = app
@@ -79,10 +70,18 @@ class AlbumsPage(urwid.Columns, AbstractPage):
             self.songlist
         ])
 
+    @on_main_loop
     def populate(self, *_):
+        if self.defer_if_hidden():
+            return
         self.albumslist.populate(gp.cached_albums)
         self.app.redraw()
 
+    def refresh(self):
+        # Keep the placeholder until the library is parsed
+        if gp.cached_albums:
+            self.populate()
+
     def playlist_activated(self, album):
         """
         Called when specific playlist is selected.
@@ -5,14 +5,15 @@ import urwid
 
 from .page import AbstractPage, AbstractListItem, AbstractListBox
 from clay.core import gp
-from clay.ui.urwid import SongListBox
+from clay.ui.urwid import SongListBox, on_main_loop
 
 
 class ArtistListBox(AbstractListBox):
     def populate(self, artists):
         items = []
-        for artist in sorted(artists, key=artists.__getitem__):
-            artist = AbstractListItem(artists[artist], self._icon)
+        # The artists are already ordered by name
+        for artist in artists.values():
+            artist = AbstractListItem(artist, self._icon)
             urwid.connect_signal(artist, 'activate', self.item_activated)
             items.append(artist)
         self.walker[:] = items
@@ -37,20 +38,9 @@ class ArtistsPage(urwid.Columns, AbstractPage):
     - List of artists
     - List of albums by selected artist
     """
-    @property
-    def name(self):
-        return 'Artists'
-
-    @property
-    def key(self):
-        return 2
-
-    @property
-    def slug(self):
-        """
-        Return page ID (`str`)
-        """
-        return "artists"
+    name = 'Artists'
+    key = 2
+    slug = 'artists'
 
     def __init__(self, app):
         self.app = app
@@ -68,10 +58,18 @@ class ArtistsPage(urwid.Columns, AbstractPage):
         super(ArtistsPage, self).__init__(
             [self.artistlist, self.albumlist, self.songlist])
 
-    def populate(self):
+    @on_main_loop
+    def populate(self, *_):
+        if self.defer_if_hidden():
+            return
         self.artistlist.populate(gp.cached_artists)
         self.app.redraw()
 
+    def refresh(self):
+        # Keep the placeholder until the library is parsed
+        if gp.cached_artists:
+            self.populate()
+
     def item_activated(self, artist):
         if artist.albums is not None:
             self.albumlist.populate(artist.albums)
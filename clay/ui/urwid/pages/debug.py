@@ -4,7 +4,7 @@ Debug page.
 import urwid
 
 from .page import AbstractPage
-from .. import hotkey_manager, copy  # short for clay.ui.urwid
+from .. import hotkey_manager, copy, on_main_loop  # short for clay.ui.urwid
 from clay.core import logger, gp
 
 
@@ -44,6 +44,10 @@ class DebugPage(urwid.Pile, AbstractPage):
     """
     Represents debug page.
     """
+    name = 'Debug'
+    key = 0
+    slug = 'debug'
+
     def __init__(self, app):
         self.app = app
         self.walker = urwid.SimpleListWalker([])
@@ -66,6 +70,7 @@ class DebugPage(urwid.Pile, AbstractPage):
 
         self.update()
 
+    @on_main_loop
     def update(self, *_):
         """
         Update this widget.
@@ -78,6 +83,7 @@ class DebugPage(urwid.Pile, AbstractPage):
             )
         )
 
+    @on_main_loop
     def _append_log(self, log_record):
         """
         Add log record to list.
@@ -85,27 +91,6 @@ class DebugPage(urwid.Pile, AbstractPage):
         self.walker.insert(0, urwid.Divider(u'\u2500'))
         self.walker.insert(0, DebugItem(log_record))
 
-    @property
-    def name(self):
-        """
-        Return page name.
-        """
-        return "Debug"
-
-    @property
-    def slug(self):
-        """
-        Return page ID (str).
-        """
-        return "debug"
-
-    @property
-    def key(self):
-        """
-        Return page key (``int``), used for hotkeys.
-        """
-        return 0
-
     def activate(self):
         """
         Notify page that it is activated.
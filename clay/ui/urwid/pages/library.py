@@ -4,8 +4,9 @@ Library page.
 import urwid
 
 from .page import AbstractPage
-from .. import SongListBox, notification_area
+from .. import SongListBox, notification_area, on_main_loop
 from clay.core import gp
+from clay.core.gp.library import LibraryView
 
 
 class LibraryPage(urwid.Columns, AbstractPage):
@@ -18,20 +19,9 @@ class LibraryPage(urwid.Columns, AbstractPage):
     def append(self):
         return True
 
-    @property
-    def name(self):
-        return 'Library'
-
-    @property
-    def key(self):
-        return 1
-
-    @property
-    def slug(self):
-        """
-        Return page ID (str).
-        """
-        return "library"
+    name = 'Library'
+    key = 1
+    slug = 'library'
 
     def __init__(self, app):
         self.app = app
@@ -40,11 +30,13 @@ class LibraryPage(urwid.Columns, AbstractPage):
 
         gp.auth_state_changed += self.get_all_songs
         gp.caches_invalidated += self.get_all_songs
+        gp.parsed_songs += self.on_parsed_songs
 
         super(LibraryPage, self).__init__([
             self.songlist
         ])
 
+    @on_main_loop
     def on_get_all_songs(self, tracks, error):
         """
         Called when all library songs are fetched from server.
@@ -53,18 +45,47 @@ class LibraryPage(urwid.Columns, AbstractPage):
         if error:
             notification_area.notify('Failed to load my library: {}'.format(str(error)))
             return
-        tracks.sort(key=lambda k: k.original_data['title'])
-        self.songlist.populate(tracks)
+        if self.defer_if_hidden():
+            return
+        self.songlist.populate(tracks.view(tracks.sorted_rows('title')))
         self.app.redraw()
 
+    @on_main_loop
+    def on_parsed_songs(self, tracks):
+        """
+        Called when library songs are parsed.
+        Updates the rows of the changed songs when changes were merged into the library.
+        """
+        # The initial load is handled by on_get_all_songs
+        if tracks is gp.cached_tracks:
+            return
+        if self.defer_if_hidden():
+            return
+
+        table = gp.cached_tracks
+        shown = self.songlist.tracks
+        if not isinstance(shown, LibraryView) or shown.table is not table:
+            self.on_get_all_songs(table, None)
+            return
+
+        rows = table.resort_rows(shown.indexes, 'title', tracks.indexes)
+        self.songlist.update_tracks(table.view(rows), tracks.get_column('id_'))
+        self.app.redraw()
+
+    @on_main_loop
     def get_all_songs(self, *_):
         """
         Called when auth state changes or GP caches are invalidated.
         """
+        if self.defer_if_hidden():
+            return
         if gp.is_authenticated:
             self.songlist.set_placeholder(u'\n \uf01e Loading song list...')
             gp.get_all_tracks_async(callback=self.on_get_all_songs)
             self.app.redraw()
 
+    def refresh(self):
+        self.get_all_songs()
+
     def activate(self):
         pass
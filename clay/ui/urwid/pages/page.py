@@ -4,14 +4,27 @@ Generic page classes.
 
 import urwid
 
-from clay.core import gp
-from clay.ui.urwid import hotkey_manager, notification_area
+from clay.core import gp, offline_manager
+from clay.core.offline import get_collection_key
+from clay.ui.urwid import hotkey_manager, notification_area, on_main_loop
 
 
 class AbstractPage(object):
     """
     Represents app page.
+
+    Pages are constructed when they are shown for the first time. A page that is
+    hidden when its data changes only marks itself as :attr:`dirty`, it is refreshed
+    once it is shown again.
     """
+    #: Page name
+    name = None
+    #: Page key (``int``), used for hotkeys
+    key = None
+    #: Page ID (``str``)
+    slug = None
+    #: ``True`` if the page has to be refreshed before it is shown, new pages are
+    dirty = True
 
     @property
     def append(self):
@@ -21,18 +34,27 @@ class AbstractPage(object):
         return False
 
     @property
-    def name(self):
+    def is_visible(self):
         """
-        Return page name.
+        Return ``True`` if this page is currently shown.
         """
-        raise NotImplementedError()
+        return self.app.current_page is self
 
-    @property
-    def key(self):
+    def defer_if_hidden(self):
         """
-        Return page key (``int``), used for hotkeys.
+        Mark this page as dirty and return ``True`` if it is hidden.
+        Data event handlers return early then, :meth:`refresh` catches up later.
+        """
+        if self.is_visible:
+            return False
+        self.dirty = True
+        return True
+
+    def refresh(self):
+        """
+        Load the current data into this page.
+        Called before the page is shown if it is :attr:`dirty`.
         """
-        raise NotImplementedError()
 
     def activate(self):
         """
@@ -58,6 +80,31 @@ class AbstractListItem(urwid.Columns):
     def activate(self):
         urwid.emit_signal(self, 'activate', self._value)
 
+    def toggle_offline(self):
+        """
+        Make the item available offline or stop keeping it available offline.
+        """
+        if get_collection_key(self._value) is None:
+            notification_area.notify('Only playlists, albums and stations can be made '
+                                     'available offline')
+        elif offline_manager.is_marked(self._value):
+            offline_manager.unmark(self._value)
+            notification_area.notify('"{}" is no longer available offline'
+                                     .format(self._value.name))
+        else:
+            notification = notification_area.notify('Making "{}" available offline...'
+                                                    .format(self._value.name))
+
+            def on_marked(tracks, error):
+                if error:
+                    notification.update('Failed to make "{}" available offline: {}'
+                                        .format(self._value.name, str(error)))
+                else:
+                    notification.update('Downloading {} tracks of "{}"'
+                                        .format(tracks, self._value.name))
+
+            offline_manager.mark_async(self._value, callback=on_marked)
+
 
 class AbstractListBox(urwid.ListBox):
     signals = ['activate']
@@ -76,6 +123,7 @@ class AbstractListBox(urwid.ListBox):
         """
         pass
 
+    @on_main_loop
     def populate(self, values, error=None):
         if error:
             notification_area.notify("Failed to fetch {}: {}"
@@ -5,7 +5,7 @@ import urwid
 
 from .page import AbstractPage
 from clay.playback.player import get_player
-from clay.ui.urwid import SongListBox
+from clay.ui.urwid import SongListBox, on_main_loop
 
 
 player = get_player()
@@ -15,26 +15,14 @@ class QueuePage(urwid.Columns, AbstractPage):
     """
     Queue page.
     """
-    @property
-    def name(self):
-        return 'Queue'
-
-    @property
-    def key(self):
-        return 7
-
-    @property
-    def slug(self):
-        """
-        Return page ID (str).
-        """
-        return "queue"
+    name = 'Queue'
+    key = 7
+    slug = 'queue'
 
     def __init__(self, app):
         self.app = app
         self.songlist = SongListBox(app)
 
-        self.songlist.populate(player.get_queue_tracks())
         player.queue_changed += self.queue_changed
         player.track_appended += self.track_appended
         player.track_removed += self.track_removed
@@ -43,26 +31,38 @@ class QueuePage(urwid.Columns, AbstractPage):
             self.songlist
         ])
 
+    @on_main_loop
     def queue_changed(self):
         """
         Called when player queue is changed.
         Updates this queue widget.
         """
+        if self.defer_if_hidden():
+            return
         self.songlist.populate(player.get_queue_tracks())
 
+    @on_main_loop
     def track_appended(self, track):
         """
         Called when new track is appended to the player queue.
         Appends track to this queue widget.
         """
+        if self.defer_if_hidden():
+            return
         self.songlist.append_track(track)
 
+    @on_main_loop
     def track_removed(self, track):
         """
         Called when a track is removed from the player queue.
         Removes track from this queue widget.
         """
+        if self.defer_if_hidden():
+            return
         self.songlist.remove_track(track)
 
+    def refresh(self):
+        self.songlist.populate(player.get_queue_tracks())
+
     def activate(self):
         pass
@@ -5,7 +5,7 @@ import urwid
 
 from .page import AbstractPage, AbstractListBox
 from clay.core import gp
-from clay.ui.urwid import SongListBox
+from clay.ui.urwid import SongListBox, on_main_loop
 
 
 class PlaylistListBox(AbstractListBox):
@@ -15,6 +15,7 @@ class PlaylistListBox(AbstractListBox):
     def __init__(self, app, icon):
         super(PlaylistListBox, self).__init__(app, icon)
 
+    @on_main_loop
     def auth_state_changed(self, is_auth):
         """
         Called when auth state changes (e. g. user is logged in).
@@ -36,20 +37,9 @@ class PlaylistsPage(urwid.Columns, AbstractPage):
     - List of playlists (:class:`.PlaylistListBox`)
     - List of songs in selected playlist (:class:`clay:songlist:SongListBox`)
     """
-    @property
-    def name(self):
-        return 'Playlists'
-
-    @property
-    def key(self):
-        return 5
-
-    @property
-    def slug(self):
-        """
-        Return page ID (str).
-        """
-        return "playlists"
+    name = 'Playlists'
+    key = 5
+    slug = 'playlists'
 
     def __init__(self, app):
         self.app = app
@@ -67,6 +57,9 @@ class PlaylistsPage(urwid.Columns, AbstractPage):
             self.songlist
         ])
 
+    def refresh(self):
+        self.playlistlist.auth_state_changed(gp.is_authenticated)
+
     def playlist_activated(self, playlist):
         """
         Called when specific playlist is selected.
@@ -5,7 +5,7 @@ import urwid
 
 from .page import AbstractPage
 from clay.core import gp
-from clay.ui.urwid import SongListBox, notification_area, hotkey_manager
+from clay.ui.urwid import SongListBox, notification_area, hotkey_manager, on_main_loop
 
 
 class ArtistListBox(urwid.ListBox):
@@ -54,26 +54,17 @@ class SearchPage(urwid.Pile, AbstractPage):
     def append(self):
         return True
 
-    @property
-    def name(self):
-        return 'Search'
-
-    @property
-    def key(self):
-        return 6
-
-    @property
-    def slug(self):
-        """
-        Return page ID (str).
-        """
-        return "search"
+    name = 'Search'
+    key = 6
+    slug = 'search'
 
     def __init__(self, app):
         self.app = app
         self.songlist = SongListBox(app)
         self._focus_position = 0
         self.search_box = SearchBox()
+        self._search_future = None
+        self._query = None
 
         urwid.connect_signal(self.search_box, 'search-requested', self.perform_search)
 
@@ -90,12 +81,21 @@ class SearchPage(urwid.Pile, AbstractPage):
         self.songlist.set_placeholder(u' \U0001F50D Searching for "{}"...'.format(
             query
         ))
-        gp.search_async(query, callback=self.search_finished)
-
-    def search_finished(self, results, error):
+        if self._search_future is not None:
+            self._search_future.cancel()
+        self._query = query
+        self._search_future = gp.search_async(query, callback=self.search_finished,
+                                              extra=dict(query=query))
+
+    @on_main_loop
+    def search_finished(self, results, error, query=None):
         """
         Populate song list with search results.
         """
+        if query != self._query:
+            # A newer search superseded this one
+            return
+
         if error:
             notification_area.notify('Failed to search: {}'.format(str(error)))
         else:
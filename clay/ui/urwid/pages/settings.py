@@ -16,20 +16,9 @@ class SettingsPage(urwid.Columns, AbstractPage):
     """
     Settings page.
     """
-    @property
-    def name(self):
-        return 'Settings'
-
-    @property
-    def key(self):
-        return 9
-
-    @property
-    def slug(self):
-        """
-        Return page ID (str).
-        """
-        return "settings"
+    name = 'Settings'
+    key = 9
+    slug = 'settings'
 
     def __init__(self, app):
         self.app = app
@@ -43,7 +32,7 @@ class SettingsPage(urwid.Columns, AbstractPage):
             edit_text=settings_manager.get('device_id', 'play_settings') or ''
         )
         self.download_tracks = urwid.CheckBox(
-            'Download tracks before playback',
+            'Save played tracks into the cache',
             state=settings_manager.get('download_tracks', 'play_settings') or False
         )
         super(SettingsPage, self).__init__([urwid.ListBox(urwid.SimpleListWalker([
@@ -5,7 +5,7 @@ import urwid
 
 from .page import AbstractPage, AbstractListBox
 from clay.core import gp
-from clay.ui.urwid import SongListBox, notification_area
+from clay.ui.urwid import SongListBox, notification_area, on_main_loop
 
 
 class StationListBox(AbstractListBox):
@@ -15,6 +15,7 @@ class StationListBox(AbstractListBox):
     def __init__(self, app, icon):
         super(StationListBox, self).__init__(app, icon)
 
+    @on_main_loop
     def auth_state_changed(self, is_auth):
         """
         Called when auth state changes (e. g. user is logged in).
@@ -37,20 +38,9 @@ class StationsPage(urwid.Columns, AbstractPage):
     - List of stations (:class:`.StationBox`)
     - List of songs in selected station (:class:`clay:songlist:SongListBox`)
     """
-    @property
-    def name(self):
-        return 'Stations'
-
-    @property
-    def key(self):
-        return 4
-
-    @property
-    def slug(self):
-        """
-        Return page ID (str).
-        """
-        return "stations"
+    name = 'Stations'
+    key = 4
+    slug = 'stations'
 
     def __init__(self, app):
         self.app = app
@@ -58,6 +48,8 @@ class StationsPage(urwid.Columns, AbstractPage):
         self.stationlist = StationListBox(app, '\u2708')
         self.songlist = SongListBox(app)
         self.songlist.set_placeholder('\n Select a station.')
+        self._station = None
+        self._load_future = None
 
         urwid.connect_signal(
             self.stationlist, 'activate', self.station_activated
@@ -68,19 +60,30 @@ class StationsPage(urwid.Columns, AbstractPage):
             self.songlist
         ])
 
+    def refresh(self):
+        self.stationlist.auth_state_changed(gp.is_authenticated)
+
     def station_activated(self, station):
         """
         Called when specific station  is selected.
         Requests fetching of station tracks
         """
         self.songlist.set_placeholder(u'\n \uf01e Loading station tracks...')
-        station.load_tracks_async(callback=self.on_station_loaded)
+        if self._load_future is not None:
+            self._load_future.cancel()
+        self._station = station
+        self._load_future = station.load_tracks_async(callback=self.on_station_loaded)
 
+    @on_main_loop
     def on_station_loaded(self, station, error):
         """
         Called when station  tracks  fetch completes.
         Populates songlist with tracks from the selected station.
         """
+        if station is not None and station is not self._station:
+            # Another station was selected in the meantime
+            return
+
         if error:
             notification_area.notify('Failed to get station tracks: {}'.format(str(error)))
 
@@ -6,6 +6,8 @@ import urwid
 from clay.core import settings_manager, meta
 from clay.playback.player import get_player
 
+from .dispatcher import on_main_loop
+
 
 player = get_player()
 
@@ -118,31 +120,31 @@ class PlayBar(urwid.Pile):
         return PlayBar.ROTATING[self.rotating_index % len(PlayBar.ROTATING)]
 
     @staticmethod
-    def get_style():
+    def get_style(state):
         """
-        Return the style for current playback state.
+        Return the style for playback *state*.
         """
-        if player.loading or player.playing:
+        if state.loading or state.playing:
             return 'title-playing'
         return 'title-idle'
 
-    def get_text(self):
+    def get_text(self, state):
         """
         Return text for display in this bar.
         """
-        track = player.get_current_track()
+        track = state.track
         if track is None:
             return u'{} {}'.format(
                 meta.APP_NAME,
                 meta.VERSION_WITH_CODENAME
             )
-        progress = player.play_progress_seconds
-        total = player.length_seconds
-        return (self.get_style(), u' {} {} - {} {} [{:02d}:{:02d} / {:02d}:{:02d}]'.format(
+        progress = state.progress_seconds
+        total = state.length_seconds
+        return (self.get_style(state), u' {} {} - {} {} [{:02d}:{:02d} / {:02d}:{:02d}]'.format(
             # u'|>' if player.is_playing else u'||',
             # self.get_rotating_bar(),
-            u'\u2505' if player.loading
-            else u'\u25B6' if player.playing
+            u'\u2505' if state.loading
+            else u'\u25B6' if state.playing
             else u'\u25A0',
             track.artist,
             track.title,
@@ -153,17 +155,19 @@ class PlayBar(urwid.Pile):
             total % 60,
         ))
 
+    @on_main_loop
     def update(self, *_):
         """
         Force update of this widget.
         Called when something unrelated to completion value changes,
         e.g. current track or playback flags.
         """
-        self.text.set_text(self.get_text())
-        self.progressbar.set_progress(player.play_progress)
+        state = player.state
+        self.text.set_text(self.get_text(state))
+        self.progressbar.set_progress(state.progress)
         self.progressbar.set_done_style(
             'progressbar_done'
-            if player.playing
+            if state.playing
             else 'progressbar_done_paused'
         )
         self.shuffle_el.attr = 'flag-active' \
@@ -177,6 +181,7 @@ class PlayBar(urwid.Pile):
             else 'flag'
         self.app.redraw()
 
+    @on_main_loop
     def stop(self, *_):
         """
         Force update of this widget.
@@ -0,0 +1,132 @@
+"""
+Incremental filtering of song lists.
+"""
+#: Filter modes, see :class:`.SongFilter`
+MODES = ('substring', 'tokens', 'fuzzy')
+
+
+class _Matches(object):
+    """
+    The indexes of the keys that match a query. In fuzzy mode also the positions of the
+    first and after the last matched character in every key.
+    """
+    def __init__(self, query, rows, starts=None, ends=None):
+        self.query = query
+        self.rows = rows
+        self.starts = starts
+        self.ends = ends
+        self.ranked = None
+
+
+class SongFilter(object):
+    """
+    Filters a song list by a query while it is typed.
+
+    Matches against casefolded search keys (one per track) that are computed once.
+    A query that extends the previous one only searches the previous matches, and the
+    matches of the shorter queries are kept on a stack, so backspace doesn't search at all.
+
+    Modes:
+
+    - ``substring``: the key contains the query, in list order.
+    - ``tokens``: the key contains every word of the query in any order. Matches at the
+      start of words rank first, then matches closer to the start of the key.
+    - ``fuzzy``: the key contains the characters of the query in order. Matches where
+      the characters are closer together rank first.
+    """
+    #: Matches are ranked only if there are at most this many, ranking more takes longer
+    #: than a frame and the next character narrows them down anyway
+    MAX_RANKED = 2000
+
+    def __init__(self, keys, mode='substring'):
+        if mode not in MODES:
+            raise ValueError('Unknown filter mode: {}'.format(mode))
+        self.keys = keys
+        self.mode = mode
+        self._stack = [_Matches('', range(len(keys)))]
+
+    def filter(self, query):
+        """
+        Return the indexes of the keys that match *query*, best matches first.
+        """
+        query = query.casefold()
+        if self.mode == 'fuzzy':
+            query = query.replace(' ', '')
+
+        while not query.startswith(self._stack[-1].query):
+            self._stack.pop()
+        matches = self._stack[-1]
+        if query != matches.query:
+            matches = self._match(query, matches)
+            self._stack.append(matches)
+
+        if matches.ranked is None:
+            matches.ranked = self._rank(matches)
+        return matches.ranked
+
+    def _match(self, query, previous):
+        """
+        Return the :class:`._Matches` of *query* among the *previous* matches of a prefix of it.
+        """
+        keys = self.keys
+        if self.mode == 'substring':
+            return _Matches(query, [index for index in previous.rows if query in keys[index]])
+
+        if self.mode == 'tokens':
+            # The previous matches contain the previous tokens already
+            known = set(previous.query.split())
+            rows = previous.rows
+            for token in query.split():
+                if token not in known:
+                    rows = [index for index in rows if token in keys[index]]
+            return _Matches(query, rows)
+
+        rows, starts, ends = previous.rows, previous.starts, previous.ends
+        for char in query[len(previous.query):]:
+            matched_rows, matched_starts, matched_ends = [], [], []
+            if starts is None:
+                for index in rows:
+                    position = keys[index].find(char)
+                    if position >= 0:
+                        matched_rows.append(index)
+                        matched_starts.append(position)
+                        matched_ends.append(position + 1)
+            else:
+                for index, start, end in zip(rows, starts, ends):
+                    position = keys[index].find(char, end)
+                    if position >= 0:
+                        matched_rows.append(index)
+                        matched_starts.append(start)
+                        matched_ends.append(position + 1)
+            rows, starts, ends = matched_rows, matched_starts, matched_ends
+        return _Matches(query, rows, starts, ends)
+
+    def _rank(self, matches):
+        """
+        Return the rows of *matches* ordered by how well they match.
+        """
+        rows = matches.rows
+        if self.mode == 'substring' or not matches.query or len(rows) > self.MAX_RANKED:
+            return rows
+
+        if self.mode == 'fuzzy':
+            starts, ends = matches.starts, matches.ends
+            order = sorted(range(len(rows)),
+                           key=lambda n: (ends[n] - starts[n], starts[n], rows[n]))
+            return [rows[n] for n in order]
+
+        keys = self.keys
+        tokens = matches.query.split()
+
+        def score(index):
+            """
+            Return the number of tokens that don't match at the start of a word
+            and the sum of their positions.
+            """
+            key = keys[index]
+            positions = [key.find(token) for token in tokens]
+            inner = sum(1 for position in positions
+                        if position > 0 and key[position - 1] != ' ')
+            return inner, sum(positions), index
+
+        return sorted(rows, key=score)
@@ -1,15 +1,20 @@
 """
 Components for song listing.
 """
+from collections import OrderedDict
+import os
 from enum import Enum
 import urwid
 
 from clay.core import gp, settings_manager
+from clay.core.gp.library import LibraryView
 from clay.playback.player import get_player
 
 from .notifications import notification_area
 from .hotkeys import hotkey_manager
 from .clipboard import copy
+from .dispatcher import on_main_loop
+from .songfilter import SongFilter, MODES
 from .variables import States, Icons
 
 player = get_player()
@@ -103,6 +108,8 @@ class SongListItem(urwid.Pile):
         ])
 
         self.is_focused = False
+        self._canvas = None
+        self._canvas_key = None
 
         super(SongListItem, self).__init__([
             self.content
@@ -120,7 +127,7 @@ class SongListItem(urwid.Pile):
         - :attr:`States.paused`
         """
         self.state = state
-        self.update_text()
+        self._invalidate()
 
     @staticmethod
     def get_state_icon(state):
@@ -133,6 +140,8 @@ class SongListItem(urwid.Pile):
         """
         Update text of this item from the attached track.
         """
+        self.rating = Icons.ratings[self.track.rating]
+        self.explicit = Icons.explicit[self.track.explicit_rating]
         self.line1.update_text(self)
         self.line2.update_text(self)
 
@@ -141,10 +150,17 @@ class SongListItem(urwid.Pile):
         """
         Return song artist and title.
         """
+        return self.format_full_title(self.track.artist, self.track.title, self.track.rating)
+
+    @staticmethod
+    def format_full_title(artist, title, rating):
+        """
+        Return the :attr:`full_title` of a track with *artist*, *title* and *rating*.
+        """
         return u'{} - {} {}'.format(
-            self.track.artist,
-            self.track.title,
-            self.rating
+            artist,
+            title,
+            Icons.ratings[rating]
         )
 
     def keypress(self, size, key):
@@ -167,12 +183,14 @@ class SongListItem(urwid.Pile):
         Thumb the currently selected song up.
         """
         self.track.rate_song((0 if self.track.rating == 5 else 5))
+        self._invalidate()
 
     def thumbs_down(self):
         """
         Thumb the currently selected song down.
         """
         self.track.rate_song((0 if self.track.rating == 1 else 1))
+        self._invalidate()
 
     def _send_signal(self, signal):
         urwid.emit_signal(self, signal, self)
@@ -235,15 +253,26 @@ class SongListItem(urwid.Pile):
         Set numeric index for this item.
         """
         self.index = index
-        self.update_text()
+        self._invalidate()
 
     def render(self, size, focus=False):
         """
         Render widget & set focused state.
+
+        The canvas is reused until the track, its displayed fields (e.g. after rating it),
+        whether it is cached, the state, focus, index or width of this item change, the text
+        is only formatted again then.
         """
-        self.is_focused = focus
-        self.update_text()
-        return super(SongListItem, self).render(size, focus)
+        track = self.track
+        key = (track, track.title, track.artist, track.album_name, track.rating,
+               track.explicit_rating, settings_manager.get_is_file_cached(track.filename),
+               self.state, focus, self.index, size)
+        if key != self._canvas_key:
+            self.is_focused = focus
+            self.update_text()
+            self._canvas = super(SongListItem, self).render(size, focus)
+            self._canvas_key = key
+        return self._canvas
 
 
 class SongListBoxPopup(urwid.LineBox):
@@ -383,6 +412,265 @@ class SongListBoxPopup(urwid.LineBox):
         urwid.emit_signal(self, 'close')
 
 
+class SongListWalker(urwid.ListWalker):
+    """
+    List walker over a sequence of tracks, e.g. a :class:`clay.core.gp.library.LibraryView`.
+
+    Creates a :class:`.SongListItem` only when the list box asks for a row, that is for
+    the rows around the viewport. The items of the :attr:`MAX_ITEMS` most recently shown
+    rows are kept, older ones are created again when they come back into view.
+    Play states are stored per track index, so a recreated item looks the same.
+    The indexes of the tracks are looked up by track ID, see :meth:`find_track`.
+
+    Positions are indexes into :attr:`rows`, the indexes of the shown tracks.
+    """
+    #: Number of item widgets kept
+    MAX_ITEMS = 200
+
+    def __init__(self, create_item):
+        self._create_item = create_item
+        self.tracks = []
+        self.rows = range(0)
+        #: ``True`` if only some of the tracks are shown
+        self.filtered = False
+        #: ``True`` if items are numbered by their position instead of their track index
+        self.numbered = False
+        #: Track indexes to states other than :attr:`.States.idle`
+        self.states = {}
+        self.focus = 0
+        self._placeholder = None
+        self._items = OrderedDict()
+        self._indexes_by_id = None
+
+    def set_tracks(self, tracks):
+        """
+        Show all of *tracks* (a sequence of :class:`clay.core.gp.Track` instances).
+        """
+        # Lists may be changed by their owner later on, e.g. the player queue
+        self.tracks = list(tracks) if isinstance(tracks, list) else tracks
+        self.states = {}
+        self._placeholder = None
+        self._items.clear()
+        self._indexes_by_id = None
+        self.rows = range(0)
+        self.set_rows(None)
+
+    def set_rows(self, rows, numbered=False):
+        """
+        Show only the tracks at the indexes *rows*, all tracks if *rows* is ``None``.
+        Pass *numbered* to number the items by their position.
+        The focused track keeps the focus if it is still shown.
+        """
+        focused = self.rows[self.focus] if 0 <= self.focus < len(self.rows) else None
+        self.filtered = rows is not None
+        self.rows = rows if self.filtered else range(len(self.tracks))
+        self.numbered = numbered
+        self.focus = 0
+        if focused is not None:
+            self.focus = self.get_position(focused) or 0
+        self._modified()
+
+    def set_placeholder(self, widget):
+        """
+        Show *widget* instead of the tracks until new tracks are set.
+        """
+        self._placeholder = widget
+        self.focus = 0
+        self._modified()
+
+    def set_states(self, states):
+        """
+        Replace the non-idle states by *states* (track indexes to :class:`.States`).
+        """
+        for index in set(self.states) | set(states):
+            item = self._items.get(index)
+            if item is not None:
+                item.set_state(states.get(index, States.idle))
+        self.states = dict(states)
+        self._modified()
+
+    def find_track(self, track_id):
+        """
+        Return the indexes of the tracks with the ID *track_id*.
+        """
+        if self._indexes_by_id is None:
+            self._indexes_by_id = {}
+            for index, id_ in enumerate(self._get_ids(self.tracks)):
+                self._indexes_by_id.setdefault(id_, []).append(index)
+        return self._indexes_by_id.get(track_id, ())
+
+    @staticmethod
+    def _get_ids(tracks):
+        """
+        Return the IDs of *tracks*.
+        """
+        if isinstance(tracks, LibraryView):
+            # Library tracks are identified by their library ID
+            return tracks.get_column('id_')
+        return [track.id for track in tracks]
+
+    def update_tracks(self, tracks, changed_ids):
+        """
+        Show all of *tracks*, which differ from the current tracks by a few added, removed
+        or changed tracks, e.g. after the library was synced. *changed_ids* are the IDs of
+        the changed tracks. The focus, the play states and the items of the other tracks
+        are kept, the tracks must have unique IDs.
+        """
+        old_ids = self._get_ids(self.tracks)
+        new_indexes = {id_: index for index, id_ in enumerate(self._get_ids(tracks))}
+        moved = {}
+        for index, id_ in enumerate(old_ids):
+            if id_ in new_indexes:
+                moved[index] = new_indexes[id_]
+
+        focused = self.rows[self.focus] if 0 <= self.focus < len(self.rows) else None
+        changed_ids = set(changed_ids)
+        self._items = OrderedDict(
+            (moved[index], item) for index, item in self._items.items()
+            if index in moved and old_ids[index] not in changed_ids
+        )
+        self.states = {moved[index]: state for index, state in self.states.items()
+                       if index in moved}
+        self.tracks = tracks
+        self._indexes_by_id = None
+        self._placeholder = None
+        self.filtered = False
+        self.numbered = False
+        self.rows = range(len(tracks))
+        if focused in moved:
+            self.focus = moved[focused]
+        else:
+            self.focus = max(min(self.focus, len(tracks) - 1), 0)
+        self._modified()
+
+    def invalidate_items(self, indexes):
+        """
+        Render the items of the tracks at *indexes* again, e.g. because the track was cached.
+        Returns ``True`` if any of them is shown.
+        """
+        invalidated = False
+        for index in indexes:
+            item = self._items.get(index)
+            if item is not None:
+                item._invalidate()
+                invalidated = True
+        if invalidated:
+            self._modified()
+        return invalidated
+
+    def get_position(self, index):
+        """
+        Return the position of the track at *index*, ``None`` if it is not shown.
+        """
+        if self._placeholder is not None:
+            return None
+        if not self.filtered:
+            return index if 0 <= index < len(self.rows) else None
+        try:
+            return self.rows.index(index)
+        except ValueError:
+            return None
+
+    def append_track(self, track):
+        """
+        Append *track* to the tracks and show it.
+        """
+        self.tracks = list(self.tracks) + [track]
+        if self._indexes_by_id is not None:
+            self._indexes_by_id.setdefault(track.id, []).append(len(self.tracks) - 1)
+        if self.filtered:
+            self.rows = list(self.rows) + [len(self.tracks) - 1]
+        else:
+            self.rows = range(len(self.tracks))
+        self._modified()
+
+    def remove_track(self, track):
+        """
+        Remove all items that are equal to *track*.
+        """
+        new_indexes = {}
+        tracks = []
+        for index, other in enumerate(self.tracks):
+            if other != track:
+                new_indexes[index] = len(tracks)
+                tracks.append(other)
+        if len(tracks) == len(self.tracks):
+            return
+
+        self.tracks = tracks
+        self._indexes_by_id = None
+        self.states = {new_indexes[index]: state for index, state in self.states.items()
+                       if index in new_indexes}
+        if self.filtered:
+            self.rows = [new_indexes[index] for index in self.rows if index in new_indexes]
+        else:
+            self.rows = range(len(tracks))
+        self.focus = max(min(self.focus, len(self.rows) - 1), 0)
+        self._items.clear()
+        self._modified()
+
+    def __len__(self):
+        return 1 if self._placeholder is not None else len(self.rows)
+
+    def __getitem__(self, position):
+        if self._placeholder is not None:
+            if position != 0:
+                raise IndexError(position)
+            return self._placeholder
+
+        if not 0 <= position < len(self.rows):
+            raise IndexError(position)
+        index = self.rows[position]
+        item = self._items.get(index)
+        if item is not None:
+            self._items.move_to_end(index)
+            number = position if self.numbered else index
+            if item.index != number:
+                item.set_index(number)
+            return item
+
+        item = self._create_item(self.tracks[index])
+        item.index = position if self.numbered else index
+        item.set_state(self.states.get(index, States.idle))
+        self._items[index] = item
+        if len(self._items) > self.MAX_ITEMS:
+            self._items.popitem(last=False)
+        return item
+
+    def set_focus(self, position):
+        """
+        Focus the row at *position*.
+        """
+        if position != 0 and not 0 <= position < len(self):
+            raise IndexError(position)
+        self.focus = position
+        self._modified()
+
+    def next_position(self, position):
+        """
+        Return the position after *position*.
+        """
+        if position + 1 >= len(self):
+            raise IndexError(position)
+        return position + 1
+
+    def prev_position(self, position):
+        """
+        Return the position before *position*.
+        """
+        if position <= 0:
+            raise IndexError(position)
+        return position - 1
+
+    def positions(self, reverse=False):
+        """
+        Return all positions, used for jumps to the top and the bottom of the list.
+        """
+        if reverse:
+            return range(len(self) - 1, -1, -1)
+        return range(len(self))
+
+
 class SongListBox(urwid.Frame):
     """
     Displays :class:`.SongListItem` instances.
@@ -393,12 +681,12 @@ class SongListBox(urwid.Frame):
         self.app = app
 
         self.current_item = None
-        self.tracks = []
-        self.tracks_walker = urwid.SimpleFocusListWalker([])
-        self.walker = urwid.SimpleFocusListWalker([])
+        self.walker = SongListWalker(self.create_item)
+        self._filter = None
 
         player.track_changed += self.track_changed
         player.media_state_changed += self.media_state_changed
+        settings_manager.file_cached += self.file_cached
 
         self.list_box = urwid.ListBox(self.walker)
         self.filter_prefix = '> '
@@ -440,7 +728,8 @@ class SongListBox(urwid.Frame):
             self.app.append_cancel_action(self.end_filtering)
             self.filter_query = ''
             hotkey_manager.filtering = True
-            self.tracks_walker[:] = self.walker
+            # Build the search keys now rather than on the first keystroke
+            self.get_filtered_rows()
 
             self.filter_box.set_text(self.filter_prefix)
 
@@ -457,25 +746,32 @@ class SongListBox(urwid.Frame):
             self.filter_query += char
         self.filter_box.set_text(self.filter_prefix + self.filter_query)
 
-        matches = self.get_filtered_items()
+        matches = self.get_filtered_rows()
         self.filter_info.set_text('{} matches'.format(len(matches)))
-        self.walker[:] = matches
+        self.walker.set_rows(matches, numbered=self.app.current_page.slug == 'library')
         self.walker.set_focus(0)
 
-        if self.app.current_page.slug == 'library':
-            self.update_indexes()
+    def get_filtered_rows(self):
+        """
+        Get the indexes of the tracks that match the search query.
+        """
+        if self._filter is None:
+            mode = settings_manager.get('filter_mode', 'clay_settings')
+            self._filter = SongFilter(self.get_search_keys(),
+                                      mode if mode in MODES else 'substring')
+        return self._filter.filter(self.filter_query)
 
-    def get_filtered_items(self):
+    def get_search_keys(self):
         """
-        Get song items that match the search query.
+        Return the casefolded :attr:`.SongListItem.full_title` of every track.
         """
-        matches = []
-        for songitem in self.tracks_walker:
-            if not isinstance(songitem, SongListItem):
-                continue
-            if self.filter_query.lower() in songitem.full_title.lower():
-                matches.append(songitem)
-        return matches
+        tracks = self.walker.tracks
+        if isinstance(tracks, LibraryView):
+            # Read the library columns, creating a track per row is much slower
+            titles = zip(*(tracks.get_column(column) for column in ('artist', 'title', 'rating')))
+        else:
+            titles = ((track.artist, track.title, track.rating) for track in tracks)
+        return [SongListItem.format_full_title(*title).casefold() for title in titles]
 
     def end_filtering(self):
         """
@@ -489,51 +785,49 @@ class SongListBox(urwid.Frame):
         hotkey_manager.filtering = False
         self.filter_box.set_text('')
         self.filter_info.set_text('')
-        self.walker[:] = self.tracks_walker
+        self.walker.set_rows(None)
 
     def set_placeholder(self, text):
         """
         Clear list and add one placeholder item.
         """
-        self.walker[:] = [urwid.Text(text, align='center')]
+        self.walker.set_placeholder(urwid.Text(text, align='center'))
 
-    def tracks_to_songlist(self, tracks):
+    @property
+    def tracks(self):
         """
-        Convert list of track data items into list of :class:`.SongListItem` instances.
+        Return the tracks of this song list.
         """
-        current_track = player.get_current_track()
-        items = []
-        current_index = None
-        for index, track in enumerate(tracks):
-            songitem = SongListItem(track)
-            if current_track is not None and current_track == track:
-                songitem.set_state(States.loading)
-                if current_index is None:
-                    current_index = index
-            urwid.connect_signal(
-                songitem, 'activate', self.item_activated
-            )
+        return self.walker.tracks
 
-            urwid.connect_signal(
-                songitem, 'play', self.item_play_pause
-            )
-            urwid.connect_signal(
-                songitem, 'append-requested', self.item_append_requested
-            )
-            urwid.connect_signal(
-                songitem, 'unappend-requested', self.item_unappend_requested
-            )
-            urwid.connect_signal(
-                songitem, 'clear-queue', self.clear_queue
-            )
-            urwid.connect_signal(
-                songitem, 'station-requested', self.item_station_requested
-            )
-            urwid.connect_signal(
-                songitem, 'context-menu-requested', self.context_menu_requested
-            )
-            items.append(songitem)
-        return (items, current_index)
+    def create_item(self, track):
+        """
+        Create a :class:`.SongListItem` for *track*, called by the walker for shown rows only.
+        """
+        songitem = SongListItem(track)
+        urwid.connect_signal(
+            songitem, 'activate', self.item_activated
+        )
+
+        urwid.connect_signal(
+            songitem, 'play', self.item_play_pause
+        )
+        urwid.connect_signal(
+            songitem, 'append-requested', self.item_append_requested
+        )
+        urwid.connect_signal(
+            songitem, 'unappend-requested', self.item_unappend_requested
+        )
+        urwid.connect_signal(
+            songitem, 'clear-queue', self.clear_queue
+        )
+        urwid.connect_signal(
+            songitem, 'station-requested', self.item_station_requested
+        )
+        urwid.connect_signal(
+            songitem, 'context-menu-requested', self.context_menu_requested
+        )
+        return songitem
 
     def item_play_pause(self, songitem):
         """
@@ -562,7 +856,7 @@ class SongListBox(urwid.Frame):
             player.load_queue(self.tracks, songitem.index)
 
         if hotkey_manager.filtering and page.slug != 'search':
-            self.walker[:] = self.get_filtered_items()
+            self.walker.set_rows(self.get_filtered_rows(), numbered=self.walker.numbered)
 
     @staticmethod
     def item_append_requested(songitem):
@@ -614,21 +908,26 @@ class SongListBox(urwid.Frame):
             self.app.unregister_cancel_action(self.popup.close)
             self.popup = None
 
+    @on_main_loop
     def track_changed(self, track):
         """
         Called when new track playback is started.
         Marks corresponding song item (if found in this song list) as currently played.
         """
-        for i, songitem in enumerate(self.walker):
-            if isinstance(songitem, urwid.Text):
-                continue
-            if songitem.track == track or \
-               (self.app.current_page.slug != 'queue' and songitem.track.id is track.id):
-                songitem.set_state(States.loading)
-                self.walker.set_focus(i)
-            elif songitem.state != States.idle:
-                songitem.set_state(States.idle)
+        is_queue = self.app.current_page.slug == 'queue'
+        tracks = self.walker.tracks
+        # Outside of the queue every entry of the track is marked
+        states = {index: States.loading for index in self.walker.find_track(track.id)
+                  if not is_queue or tracks[index] == track}
+        self.walker.set_states(states)
+
+        for index in sorted(states, reverse=True):
+            position = self.walker.get_position(index)
+            if position is not None:
+                self.walker.set_focus(position)
+                break
 
+    @on_main_loop
     def media_state_changed(self, is_loading, is_playing):
         """
         Called when player media state changes.
@@ -638,61 +937,77 @@ class SongListBox(urwid.Frame):
         if current_track is None:
             return
 
-        for songitem in self.walker:
-            if isinstance(songitem, urwid.Text):
-                continue
-            if songitem.track == current_track:
-                songitem.set_state(
-                    States.loading if is_loading else
-                    States.playing if is_playing else
-                    States.paused
-                )
+        state = States.loading if is_loading else \
+            States.playing if is_playing else \
+            States.paused
+        self.walker.set_states({
+            index: state if self.walker.tracks[index] == current_track else old_state
+            for index, old_state in self.walker.states.items()
+        })
         self.app.redraw()
 
+    @on_main_loop
+    def file_cached(self, filename):
+        """
+        Called when a file was added to the cache.
+        Redraws the items of the track (if found in this song list) to show it is cached.
+        """
+        track_id, extension = os.path.splitext(filename)
+        if extension != '.mp3':
+            return
+        if self.walker.invalidate_items(self.walker.find_track(track_id)):
+            self.app.redraw()
+
     def populate(self, tracks):
         """
         Display a list of :class:`clay.player.Track` instances in this song list.
         """
-        self.tracks = tracks
-        self.walker[:], current_index = self.tracks_to_songlist(self.tracks)
-        self.update_indexes()
-        if current_index is not None:
-            self.walker.set_focus(current_index)
-        elif len(self.walker) >= 1:
-            self.walker.set_focus(0)
+        self.walker.set_tracks(tracks)
+        self._filter = None
+
+        current_track = player.get_current_track()
+        if current_track is None:
+            return
+        tracks = self.walker.tracks
+        states = {index: States.loading for index in self.walker.find_track(current_track.id)
+                  if tracks[index] == current_track}
+        self.walker.set_states(states)
+        if states:
+            self.walker.set_focus(min(states))
+
+    def update_tracks(self, tracks, changed_ids):
+        """
+        Display *tracks*, a few of them added, removed or changed (*changed_ids*)
+        compared to the displayed ones, see :meth:`.SongListWalker.update_tracks`.
+        """
+        self.walker.update_tracks(tracks, changed_ids)
+        self._filter = None
+        if hotkey_manager.filtering and self.filter_query:
+            self.walker.set_rows(self.get_filtered_rows(),
+                                 numbered=self.app.current_page.slug == 'library')
 
     def clear_queue(self, _):
         """
         Removes all tracks from the queue
         """
         self.current_item = None
+        self.walker.set_states({})
         self.walker.set_focus(0)
         player.clear_queue()
 
     def append_track(self, track):
         """
-        Convert a track into :class:`.SongListItem` instance and appends it into this song list.
+        Appends *track* to this song list.
         """
-        tracks, _ = self.tracks_to_songlist([track])
-        self.walker.append(tracks[0])
-        self.update_indexes()
+        self.walker.append_track(track)
+        self._filter = None
 
     def remove_track(self, track, ):
         """
-        Remove a song item that matches *track* from this song list (if found).
-        """
-        for songlistitem in self.walker:
-            if songlistitem.track == track:
-                self.walker.remove(songlistitem)
-
-        self.update_indexes()
-
-    def update_indexes(self):
-        """
-        Update indexes of all song items in this song list.
+        Remove the song items that match *track* from this song list (if found).
         """
-        for i, songlistitem in enumerate(self.walker):
-            songlistitem.set_index(i)
+        self.walker.remove_track(track)
+        self._filter = None
 
     def keypress(self, size, key):
         return hotkey_manager.keypress("song_view", self, super(SongListBox, self), size, key)
@@ -0,0 +1,35 @@
+"""
+Tests for the columnar library table.
+"""
+from clay.core.gp.library import LibraryTable
+
+
+def make_song(number, **fields):
+    """
+    Return the song dict of a library track.
+    """
+    song = {
+        'id': 'id{}'.format(number),
+        'title': 't{}'.format(number),
+        'artist': 'Artist',
+        'trackNumber': number,
+        'durationMillis': '1000',
+    }
+    song.update(fields)
+    return song
+
+
+def test_view_is_kept_across_a_merge_with_deletions():
+    songs = [make_song(number) for number in range(1, 8)]
+    table = LibraryTable.from_data(songs)
+    view = table.view([3, 4, 5])
+
+    changed = table.merge([{'id': 'id4', 'deleted': True}, make_song(5, title='new')])
+
+    assert changed == [3, 4]
+    assert [track.title for track in table.view(changed)] == ['new']
+    assert [track.title for track in view] == ['t4', 'new', 't6']
+    assert table.index_of('id4') is None
+    assert table.is_deleted(3)
+    assert [track.title for track in table.view([3, 4, 5])] == ['new', 't6']
+    assert 3 not in table.sorted_rows('title')